@@ -27,80 +27,45 @@
 # Hervé BREDIN - http://herve.niderb.fr
 
 
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
-
-
+import sys
 import os.path as op
-from pyannote.database import Database
-from pyannote.database.protocol import SpeakerDiarizationProtocol
-from pyannote.parser import MDTMParser
-
-# this protocol defines a speaker diarization protocol: as such, a few methods
-# needs to be defined: trn_iter, dev_iter, and tst_iter.
-
-class MyProtocol1(SpeakerDiarizationProtocol):
-    """My first speaker diarization protocol """
-
-    def trn_iter(self):
-
-        # absolute path to 'data' directory where annotations are stored
-        data_dir = op.join(op.dirname(op.realpath(__file__)), 'data')
-
-        # in this example, we assume annotations are distributed in MDTM format.
-        # this is obviously not mandatory but pyannote.parser conveniently
-        # provides a built-in parser for MDTM files...
-        annotations = MDTMParser().read(
-            op.join(data_dir, 'protocol1.train.mdtm'))
-
-        # iterate over each file in training set
-        for uri in sorted(annotations.uris):
-
-            # get annotations as pyannote.core.Annotation instance
-            annotation = annotations(uri)
-
-            # `trn_iter` (as well as `dev_iter` and `tst_iter`) are expected
-            # to yield dictionary with the following fields:
-            yield {
-                # name of the database class
-                'database': 'MyDatabase',
-                # unique file identifier
-                'uri': uri,
-                # reference as pyannote.core.Annotation instance
-                'annotation': annotation
-            }
-
-            # optionally, an 'annotated' field can be added, whose value is
-            # a pyannote.core.Timeline instance containing the set of regions
-            # that were actually annotated (e.g. some files might only be
-            # partially annotated).
-
-            # this field can be used later to only evaluate those regions,
-            # for instance. whenever possible, please provide the 'annotated'
-            # field even if it trivially contains segment [0, file_duration].
-
-
-    def dev_iter(self):
-        # here, you should do the same as above, but for the development set
-        for _ in []:
-            yield
-
-    def tst_iter(self):
-        # here, you should do the same as above, but for the test set
-        for _ in []:
-            yield
-
-# this is where we define each protocol for this database.
-# without this, `pyannote.database.get_protocol` won't be able to find them...
-
-class MyDatabase(Database):
-    """MyDatabase database"""
-
-    def __init__(self, preprocessors={}, **kwargs):
-        super(MyDatabase, self).__init__(preprocessors=preprocessors, **kwargs)
-
-        # register the first protocol: it will be known as
-        # MyDatabase.SpeakerDiarization.MyFirstProtocol
-        self.register_protocol(
-            'SpeakerDiarization', 'MyFirstProtocol', MyProtocol1)
+from importlib import import_module
+
+# absolute path to 'data' directory where annotations are stored
+DATA_DIR = op.join(op.dirname(op.realpath(__file__)), 'data')
+
+# importing pyannote.database (and therefore pandas and pyannote.core) is
+# expensive: `MyDatabase` and `MyProtocol1` are only imported the first time
+# they are accessed (e.g. when `pyannote.database` loads this plugin entry
+# point), so that `import MyDatabase` itself stays cheap.
+_LAZY = {
+    'MyDatabase': '.database',
+    'MyProtocol1': '.protocol',
+}
+
+
+# in development (e.g. editable) installs, computing the version number runs
+# a handful of `git` subprocesses. it is therefore only computed the first
+# time `MyDatabase.__version__` is accessed, and never at import time.
+def __getattr__(name):
+
+    if name == '__version__':
+        from ._version import get_versions
+        version = get_versions()['version']
+        globals()['__version__'] = version
+        return version
+
+    if name in _LAZY:
+        value = getattr(import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    msg = "module '{module}' has no attribute '{name}'"
+    raise AttributeError(msg.format(module=__name__, name=name))
+
+
+# module-level __getattr__ is only supported from Python 3.7 on
+if sys.version_info < (3, 7):
+    __version__ = __getattr__('__version__')
+    from .database import MyDatabase
+    from .protocol import MyProtocol1
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Cached audio path resolution
+
+>>> from MyDatabase.audio import AudioIndex
+>>> audio = AudioIndex(['/path/to/audio', '/other/path/to/audio'])
+>>> preprocessors = {'audio': audio}
+>>> protocol = get_protocol('MyDatabase.SpeakerDiarization.MyFirstProtocol',
+...                         preprocessors=preprocessors)
+>>> audio.missing(protocol.uris('train'))  # no `stat` involved
+[]
+
+Audio roots are scanned once, recursively, and every audio file is indexed
+under its path relative to its root (without extension, e.g. 'dir/file' for
+'/path/to/audio/dir/file.wav') along with its size and modification time.
+When several roots provide the same uri, the first root wins.
+
+Audio durations are probed from file headers (see `MyDatabase.duration`), in
+parallel, and cached in the index as well:
+
+>>> durations = protocol.durations('train')  # e.g. for weighted sampling
+>>> preprocessors = {'audio': audio, 'duration': audio.duration}
+
+When the binary cache is enabled (see `MyDatabase.cache`), the index is
+saved there and shared across processes. It is revalidated lazily, the first
+time it is used by a process (or on `refresh`): this costs one `stat` per
+indexed directory (as adding, removing or renaming a file updates the
+modification time of its directory), and only changed directories are
+scanned again (forgetting their cached durations).
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import os.path as op
+
+from .cache import get_cache_dir, makedirs
+
+EXTENSIONS = ('.wav', '.flac', '.sph')
+
+# number of threads probing durations
+WORKERS = 8
+
+
+def _loops(directory, entry):
+    """Whether sub-directory `entry` of `directory` links back to an ancestor
+
+    Symbolically linked directories are followed, unless they would make the
+    scan loop forever.
+    """
+    if not entry.is_symlink():
+        return False
+    target = op.realpath(entry.path)
+    current = op.realpath(directory)
+    return current == target or current.startswith(target.rstrip(os.sep) +
+                                                   os.sep)
+
+
+class AudioIndex(object):
+    """Index of audio files, usable as 'audio' preprocessor
+
+    Parameters
+    ----------
+    roots : str or list of str
+        Directories where audio files are looked for.
+    extensions : iterable of str, optional
+        Extensions of audio files. Defaults to '.wav', '.flac' and '.sph'.
+    path : str, optional
+        Where to save the index (JSON). Defaults to the binary cache
+        directory, if enabled (otherwise, the index is not saved).
+    """
+
+    def __init__(self, roots, extensions=EXTENSIONS, path=None):
+        super(AudioIndex, self).__init__()
+        if isinstance(roots, str):
+            roots = [roots]
+        self.roots = [op.realpath(root) for root in roots]
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.path = path
+        # directory -> [root, mtime]
+        self.directories_ = None
+        # uri -> [path, size, mtime] (+ [duration] once probed)
+        self.files_ = None
+        self.validated_ = False
+        # whether probed durations still need to be saved
+        self.dirty_ = False
+
+    def _index_path(self):
+        if self.path is not None:
+            return self.path
+        cache_dir = get_cache_dir()
+        if cache_dir is None:
+            return None
+        key = u'{roots}|{extensions}'.format(
+            roots='|'.join(self.roots), extensions='|'.join(self.extensions))
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return op.join(cache_dir, 'audio.{digest}.json'.format(digest=digest))
+
+    def _read(self):
+        """Read saved index, if any (and if it matches roots and extensions)"""
+        path = self._index_path()
+        if path is None or not op.exists(path):
+            return False
+        try:
+            with open(path) as f:
+                index = json.load(f)
+        except ValueError:
+            return False
+        if index.get('roots') != self.roots or \
+                index.get('extensions') != list(self.extensions):
+            return False
+        self.directories_ = index['directories']
+        self.files_ = index['files']
+        return True
+
+    def _write(self):
+        """Save index (atomically)"""
+        path = self._index_path()
+        if path is None:
+            return
+        directory = op.dirname(op.abspath(path))
+        makedirs(directory)
+        index = {'roots': self.roots, 'extensions': list(self.extensions),
+                 'directories': self.directories_, 'files': self.files_}
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp.')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.rename(tmp, path)
+        self.dirty_ = False
+
+    def _scan(self, root, directory, recursive=True):
+        """Index audio files of `directory`
+
+        Sub-directories are scanned as well when `recursive` is True, and
+        only those that are not indexed yet otherwise.
+        """
+
+        try:
+            # stat before listing, so that concurrent changes are not missed
+            mtime = os.stat(directory).st_mtime
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        self.directories_[directory] = [root, mtime]
+
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            # e.g. broken symbolic links or files removed in the meantime
+            try:
+                if entry.is_dir():
+                    if _loops(directory, entry):
+                        continue
+                    if recursive or entry.path not in self.directories_:
+                        self._scan(root, entry.path, recursive=recursive)
+                elif entry.name.lower().endswith(self.extensions):
+                    stat = entry.stat()
+                    uri = op.splitext(op.relpath(entry.path, root))[0]
+                    self.files_.setdefault(uri.replace(os.sep, '/'),
+                                           [entry.path, stat.st_size,
+                                            stat.st_mtime])
+            except OSError:
+                continue
+
+    def _revalidate(self):
+        """Scan again directories that changed since they were indexed
+
+        Returns
+        -------
+        changed : bool
+        """
+
+        changed = []
+        for directory, (root, mtime) in sorted(self.directories_.items()):
+            try:
+                current = os.stat(directory).st_mtime
+            except OSError:
+                current = None
+            if current != mtime:
+                changed.append((root, directory))
+
+        if not changed:
+            return False
+
+        directories = set(directory for _, directory in changed)
+        self.files_ = dict((uri, entry) for uri, entry in self.files_.items()
+                           if op.dirname(entry[0]) not in directories)
+        for root, directory in changed:
+            del self.directories_[directory]
+        for root, directory in changed:
+            self._scan(root, directory, recursive=False)
+        return True
+
+    def _load(self):
+        """Build, read or revalidate index, as needed"""
+
+        if self.validated_:
+            return
+
+        if self.files_ is None and not self._read():
+            self.directories_, self.files_ = {}, {}
+            for root in self.roots:
+                self._scan(root, root)
+            self._write()
+        elif self._revalidate():
+            self._write()
+
+        self.validated_ = True
+
+    def refresh(self):
+        """Revalidate index (see module docstring)"""
+        self.validated_ = False
+        self._load()
+
+    def __call__(self, current_file):
+        """Path to audio file of `current_file`"""
+        return self.path_of(current_file['uri'])
+
+    def path_of(self, uri):
+        """Path to audio file of `uri`"""
+        self._load()
+        entry = self.files_.get(uri)
+        if entry is None:
+            msg = 'Could not find audio file for "{uri}" in {roots}.'
+            raise ValueError(msg.format(uri=uri, roots=self.roots))
+        return entry[0]
+
+    def stat(self, uri):
+        """(size, modification time) of audio file of `uri`, as indexed"""
+        self.path_of(uri)
+        _, size, mtime = self.files_[uri]
+        return size, mtime
+
+    def __contains__(self, uri):
+        self._load()
+        return uri in self.files_
+
+    def __len__(self):
+        self._load()
+        return len(self.files_)
+
+    def missing(self, uris):
+        """Uris (among `uris`) without audio file"""
+        self._load()
+        return [uri for uri in uris if uri not in self.files_]
+
+    def report(self, uris):
+        """Missing-file report of `uris`
+
+        Returns
+        -------
+        report : dict
+            'found' and 'missing' number of uris, 'missing_uris' list, and
+            'size' total size of found audio files (in bytes).
+        """
+        self._load()
+        found = [uri for uri in uris if uri in self.files_]
+        missing = self.missing(uris)
+        return {'found': len(found),
+                'missing': len(missing),
+                'missing_uris': missing,
+                'size': sum(self.files_[uri][1] for uri in found)}
+
+    def _probe(self, uri):
+        """Probe (and cache) duration of audio file of `uri`"""
+        from .duration import probe
+        entry = self.files_[uri]
+        if len(entry) < 4:
+            try:
+                duration = probe(entry[0])
+            except (IOError, OSError, ValueError):
+                # unreadable: do not try again
+                duration = None
+            self.files_[uri] = entry[:3] + [duration]
+            self.dirty_ = True
+        return self.files_[uri][3]
+
+    def duration(self, current_file):
+        """Duration of audio file of `current_file`, usable as preprocessor
+
+        Probed durations are only saved by `durations`.
+        """
+        uri = current_file['uri']
+        self.path_of(uri)
+        duration = self._probe(uri)
+        if duration is None:
+            msg = 'Could not read duration of "{uri}" audio file.'
+            raise ValueError(msg.format(uri=uri))
+        return duration
+
+    def durations(self, uris, workers=WORKERS):
+        """Durations of audio files of `uris`, probed in parallel
+
+        Parameters
+        ----------
+        uris : iterable of str
+        workers : int, optional
+            Number of threads probing file headers. Defaults to 8.
+
+        Returns
+        -------
+        durations : (n_uris, ) float64 np.ndarray
+            In seconds. NaN for missing or unreadable audio files.
+        """
+
+        import numpy as np
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._load()
+        uris = list(uris)
+
+        # probing is I/O bound (one small read per file): threads are enough
+        todo = sorted(set(uri for uri in uris
+                          if uri in self.files_ and len(self.files_[uri]) < 4))
+        if todo:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(self._probe, todo))
+        if self.dirty_:
+            self._write()
+
+        durations = np.full(len(uris), np.nan)
+        for i, uri in enumerate(uris):
+            entry = self.files_.get(uri)
+            if entry is not None and len(entry) > 3 and entry[3] is not None:
+                durations[i] = entry[3]
+        return durations
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Binary cache of parsed annotation files
+
+Set MYDATABASE_CACHE environment variable to a directory to enable it: each
+annotation file is then parsed once and saved there as a memory-mappable
+`SegmentStore` (keyed on file path, size and modification time).
+
+Set MYDATABASE_VALIDATE=1 to validate annotation files (see
+`MyDatabase.validate`) before they are cached.
+
+Processes sharing the same cache directory (e.g. DataLoader workers or
+distributed ranks starting at once) coordinate through an advisory lock
+('.lock' file next to the cached store): only one of them parses a given
+annotation file while the others wait for it to be published (through an
+atomic rename) and memory-map it. Set MYDATABASE_CACHE_WAIT=0 for them not to
+wait: they then parse the annotation file themselves, without caching it (see
+`MyDatabase.loader.load`).
+"""
+
+import os
+import json
+import errno
+import shutil
+import hashlib
+import tempfile
+import os.path as op
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows, where concurrent builds are only made safe by the
+    # atomic rename (but are not avoided)
+    fcntl = None
+
+from .parsers import read
+from .store import SegmentStore
+
+CACHE_ENV = 'MYDATABASE_CACHE'
+VALIDATE_ENV = 'MYDATABASE_VALIDATE'
+WAIT_ENV = 'MYDATABASE_CACHE_WAIT'
+
+
+def get_cache_dir():
+    """Cache directory, or None when caching is disabled"""
+    return os.environ.get(CACHE_ENV) or None
+
+
+def get_wait():
+    """Whether to wait for other processes building the same cache"""
+    return os.environ.get(WAIT_ENV, '1') not in ('', '0')
+
+
+@contextmanager
+def lock(target, blocking=True):
+    """Advisory (exclusive) lock on `target`, through a '.lock' file
+
+    Locks are released by the operating system when their owner dies, so
+    that a crashed builder never blocks other processes.
+
+    Usage
+    -----
+    >>> with lock(target, blocking=False) as locked:
+    ...     if locked:
+    ...         # build target
+
+    Yields
+    ------
+    locked : bool
+        False when `blocking` is False and the lock is held by someone else.
+    """
+
+    if fcntl is None:
+        yield True
+        return
+
+    with open(target + '.lock', 'a') as f:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(f.fileno(), flags)
+        except (IOError, OSError) as e:
+            if blocking or e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def makedirs(directory):
+    """Create `directory` unless it exists (safe against concurrent calls)"""
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # someone else created it in the meantime
+        if not op.isdir(directory):
+            raise
+
+
+def cache_path(path, fmt=None, cache_dir=None):
+    """Path to cached version of annotation file `path`"""
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    path = op.realpath(path)
+    stat = os.stat(path)
+    key = u'{path}|{fmt}|{size}|{mtime}'.format(
+        path=path, fmt=fmt, size=stat.st_size, mtime=stat.st_mtime)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    return op.join(cache_dir, '{name}.{digest}'.format(
+        name=op.basename(path), digest=digest))
+
+
+def build(path, fmt=None, cache_dir=None, validate=None, metrics=None):
+    """Parse annotation file `path` and save it into cache
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.read`.
+    cache_dir : str, optional
+        Defaults to MYDATABASE_CACHE environment variable.
+    validate : bool, optional
+        Validate annotation file first. Defaults to MYDATABASE_VALIDATE
+        environment variable.
+    metrics : MyDatabase.instrument.Metrics, optional
+        Record time spent in 'cache' stage (and parsing stages, see
+        `MyDatabase.parsers.iter_chunks`).
+
+    Returns
+    -------
+    cached : str
+        Path to cached store.
+
+    Raises
+    ------
+    ValueError
+        When validation fails (in which case nothing is cached).
+    """
+
+    if metrics is None:
+        return _build(path, fmt=fmt, cache_dir=cache_dir, validate=validate)
+    with metrics.stage('cache'):
+        return _build(path, fmt=fmt, cache_dir=cache_dir, validate=validate,
+                      metrics=metrics)
+
+
+def _build(path, fmt=None, cache_dir=None, validate=None, metrics=None):
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if validate is None:
+        validate = os.environ.get(VALIDATE_ENV, '0') not in ('', '0')
+
+    report = None
+    if validate:
+        from .validate import Validator
+        validator = Validator()
+        store = validator.read(path, fmt=fmt)
+        report = validator.report()
+        if not report['valid']:
+            msg = '{path} did not pass validation:\n{report}'
+            raise ValueError(msg.format(
+                path=path, report=json.dumps(report['files'][path]['errors'],
+                                             indent=2, sort_keys=True)))
+    else:
+        store = read(path, fmt=fmt, metrics=metrics)
+
+    target = cache_path(path, fmt=fmt, cache_dir=cache_dir)
+    if not op.isdir(cache_dir):
+        makedirs(cache_dir)
+
+    # write into temporary directory first so that a partially written cache
+    # is never visible under its final name
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp.')
+    try:
+        store.save(tmp)
+        if report is not None:
+            with open(op.join(tmp, 'report.json'), 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        os.rename(tmp, target)
+    except OSError:
+        # someone else published the same cache in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not op.isdir(target):
+            raise
+
+    return target
+
+
+def load(path, fmt=None, cache_dir=None, validate=None, metrics=None,
+         wait=None):
+    """Load annotation file `path` from cache, building cache if needed
+
+    See `build` for a description of parameters.
+
+    Parameters
+    ----------
+    wait : bool, optional
+        When another process is building the same cache, wait for it to
+        finish (default) or return None. Defaults to MYDATABASE_CACHE_WAIT
+        environment variable.
+
+    Returns
+    -------
+    store : SegmentStore or None
+    """
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if wait is None:
+        wait = get_wait()
+
+    target = cache_path(path, fmt=fmt, cache_dir=cache_dir)
+    if not op.isdir(target):
+        makedirs(cache_dir)
+        with lock(target, blocking=wait) as locked:
+            if not locked:
+                return None
+            # the cache might have been published while waiting for the lock
+            if not op.isdir(target):
+                build(path, fmt=fmt, cache_dir=cache_dir, validate=validate,
+                      metrics=metrics)
+
+    return SegmentStore.load(target)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Annotation files compiled at build time
+
+`python setup.py build_py` (hence `pip install .` and `bdist_wheel`) parses
+every file of 'data' directory and ships the resulting memory-mappable
+`SegmentStore` in 'compiled' directory, along with an 'index.json' file that
+records, for each data file, its format, size and SHA-256 checksum.
+
+Installed plugins therefore never parse their own data files. Data files
+edited after installation are detected by their checksum (computed once per
+process and version of the file, which is much cheaper than parsing it) and
+parsed again.
+"""
+
+import io
+import os
+import json
+import hashlib
+import os.path as op
+
+from . import DATA_DIR
+from .parsers import read, get_format, FORMATS
+from .store import SegmentStore
+
+COMPILED_DIR = op.join(op.dirname(DATA_DIR), 'compiled')
+INDEX = 'index.json'
+
+_INDEX = {}
+# (path, size, mtime) -> whether checksum matches the compiled one
+_VERIFIED = {}
+
+
+def checksum(path, block_size=1 << 20):
+    """SHA-256 checksum of file `path`"""
+    sha256 = hashlib.sha256()
+    with io.open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def compile_data(data_dir=DATA_DIR, compiled_dir=COMPILED_DIR):
+    """Compile every annotation file of `data_dir` into `compiled_dir`
+
+    Files whose format cannot be guessed from their extension are skipped.
+
+    Returns
+    -------
+    index : dict
+        Content of 'index.json'.
+    """
+
+    if not op.isdir(compiled_dir):
+        os.makedirs(compiled_dir)
+
+    index = {}
+    for name in sorted(os.listdir(data_dir)):
+
+        path = op.join(data_dir, name)
+        try:
+            format_ = get_format(path)
+        except ValueError:
+            continue
+        fmt = [n for n, f in FORMATS.items() if f is format_][0]
+
+        store = read(path, fmt=fmt)
+        target = op.join(compiled_dir, name)
+        if not op.isdir(target):
+            os.makedirs(target)
+        store.save(target)
+
+        index[name] = {
+            'format': fmt,
+            'size': os.stat(path).st_size,
+            'sha256': checksum(path),
+            'segments': len(store),
+            'uris': len(store.uris),
+        }
+
+    with open(op.join(compiled_dir, INDEX), 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+
+    return index
+
+
+def load_index(compiled_dir=COMPILED_DIR):
+    """Load (and memoize) 'index.json', or {} when nothing was compiled"""
+    if compiled_dir not in _INDEX:
+        try:
+            with open(op.join(compiled_dir, INDEX), 'r') as f:
+                _INDEX[compiled_dir] = json.load(f)
+        except (IOError, OSError):
+            _INDEX[compiled_dir] = {}
+    return _INDEX[compiled_dir]
+
+
+def load(path, fmt=None, verify=True):
+    """Load compiled version of data file `path`
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.read`.
+    verify : bool, optional
+        Check that `path` SHA-256 checksum matches the compiled one (once per
+        size and modification time of `path`). Set to False to only compare
+        file sizes.
+
+    Returns
+    -------
+    store : SegmentStore or None
+        Memory-mapped store, or None when `path` was not compiled (or
+        changed since).
+    """
+
+    path = op.realpath(path)
+    if op.dirname(path) != DATA_DIR:
+        return None
+
+    name = op.basename(path)
+    entry = load_index().get(name)
+    if entry is None or fmt not in (None, entry['format']):
+        return None
+
+    stat = os.stat(path)
+    if stat.st_size != entry['size']:
+        return None
+
+    if verify:
+        key = (path, stat.st_size, stat.st_mtime)
+        if key not in _VERIFIED:
+            _VERIFIED[key] = checksum(path) == entry['sha256']
+        if not _VERIFIED[key]:
+            return None
+
+    return SegmentStore.load(op.join(COMPILED_DIR, name))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+import os
+
+from pyannote.database import Database
+
+from .manifest import load_manifest, LazyProtocol
+
+# this is where we define each protocol for this database.
+# without this, `pyannote.database.get_protocol` won't be able to find them...
+
+# protocols are listed in 'protocols.json' manifest (see MyDatabase.manifest)
+# rather than registered one by one: this keeps database instantiation cheap
+# as the number of protocols grows, as no protocol class is imported (and no
+# data file is touched) until the protocol is actually requested.
+
+class MyDatabase(Database):
+    """MyDatabase database"""
+
+    def __init__(self, preprocessors={}, **kwargs):
+        super(MyDatabase, self).__init__(preprocessors=preprocessors, **kwargs)
+
+        # e.g. the first protocol will be known as
+        # MyDatabase.SpeakerDiarization.MyFirstProtocol
+        for task, protocols in load_manifest().items():
+            for name, entry in protocols.items():
+                self.register_protocol(
+                    task, name, LazyProtocol(task, name, entry))
+
+        # long-running services (e.g. MYDATABASE_WATCH=5) pick up changes to
+        # annotation files without restarting (see MyDatabase.watch). the
+        # watcher (hence the loader, numpy...) is only imported when enabled
+        if os.environ.get('MYDATABASE_WATCH'):
+            from .watch import start
+            start()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Diff two versions of an annotation file
+
+Usage: python -m MyDatabase.diff [--format=<format>] [--uris-only]
+                                 [--report=<report.json>] <old> <new>
+
+Both files are streamed chunk by chunk (see `MyDatabase.parsers.iter_chunks`)
+and every segment is hashed (vectorized 64-bit hash of its start time,
+duration and label). Per-uri digests are order-independent sums of segment
+hashes, so that a uri is only reported as changed when its segments actually
+differ (not when they are merely reordered), and segments of a given uri do
+not even need to be contiguous. This is linear in the size of the files and
+only keeps one digest per uri in memory.
+
+Segments of changed uris are then collected in a second pass over both
+files (unless --uris-only) to report added and removed segments.
+
+Exits with status 1 when files differ (as `diff` does).
+"""
+
+import sys
+import json
+import hashlib
+from collections import Counter
+
+import numpy as np
+
+from .parsers import iter_chunks, CHUNK_SIZE
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(x):
+    """splitmix64 finalizer (vectorized over uint64 np.ndarray)"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _label_hash(label):
+    digest = hashlib.sha1(label.encode('utf-8')).digest()[:8]
+    return int(np.frombuffer(digest, dtype=np.uint64)[0])
+
+
+def segment_hashes(columns):
+    """64-bit hash of each segment (start, duration, label) of a chunk
+
+    Returns
+    -------
+    hashes : (n_segments, ) uint64 np.ndarray
+    """
+
+    labels, label = np.unique(columns['label'], return_inverse=True)
+    label_hashes = np.array([_label_hash(l) for l in labels.tolist()],
+                            dtype=np.uint64)
+
+    start = np.ascontiguousarray(columns['start'], dtype=np.float64)
+    duration = np.ascontiguousarray(columns['duration'], dtype=np.float64)
+
+    with np.errstate(over='ignore'):
+        h = _mix(start.view(np.uint64))
+        h = _mix(h ^ duration.view(np.uint64))
+        return _mix(h ^ label_hashes[label])
+
+
+def digests(path, fmt=None, chunk_size=CHUNK_SIZE):
+    """Per-uri digests of annotation file `path`
+
+    Returns
+    -------
+    digests : dict
+        Maps each uri to its (number of segments, 64-bit digest) pair.
+    """
+
+    digests = {}
+    for columns in iter_chunks(path, fmt=fmt, chunk_size=chunk_size):
+
+        if not len(columns['uri']):
+            continue
+
+        hashes = segment_hashes(columns)
+        uris, uri = np.unique(columns['uri'], return_inverse=True)
+        order = np.argsort(uri, kind='stable')
+        counts = np.bincount(uri, minlength=len(uris))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        # uint64 additions wrap around: sums are taken modulo 2^64
+        sums = np.add.reduceat(hashes[order], starts)
+
+        for u, count, total in zip(uris.tolist(), counts.tolist(),
+                                   sums.tolist()):
+            n, digest = digests.get(u, (0, 0))
+            digests[u] = (n + count, (digest + total) & _MASK)
+
+    return digests
+
+
+def _segments(path, uris, fmt=None, chunk_size=CHUNK_SIZE):
+    """Segments of `uris`, as {uri: Counter of (start, duration, label)}"""
+
+    segments = dict((uri, Counter()) for uri in uris)
+    if not segments:
+        return segments
+
+    selected = np.array(sorted(segments), dtype=np.str_)
+    for columns in iter_chunks(path, fmt=fmt, chunk_size=chunk_size):
+        keep = np.isin(columns['uri'], selected)
+        if not np.any(keep):
+            continue
+        for uri, start, duration, label in zip(
+                columns['uri'][keep].tolist(),
+                columns['start'][keep].tolist(),
+                columns['duration'][keep].tolist(),
+                columns['label'][keep].tolist()):
+            segments[uri][(start, duration, label)] += 1
+
+    return segments
+
+
+def diff(old, new, fmt=None, segments=True, chunk_size=CHUNK_SIZE):
+    """Diff two versions of an annotation file
+
+    Parameters
+    ----------
+    old, new : str
+        Paths to both versions of the annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.iter_chunks`.
+    segments : bool, optional
+        Report added and removed segments of changed uris (needs a second
+        pass over both files). Defaults to True.
+
+    Returns
+    -------
+    report : dict
+        'added', 'removed' and 'changed' sorted lists of uris, number of
+        'unchanged' uris, and (when `segments` is True) 'segments' mapping
+        each changed uri to its 'added' and 'removed' [start, duration,
+        label] segments.
+    """
+
+    before = digests(old, fmt=fmt, chunk_size=chunk_size)
+    after = digests(new, fmt=fmt, chunk_size=chunk_size)
+
+    changed = sorted(uri for uri in set(before) & set(after)
+                     if before[uri] != after[uri])
+    report = {
+        'added': sorted(set(after) - set(before)),
+        'removed': sorted(set(before) - set(after)),
+        'changed': changed,
+        'unchanged': len(set(before) & set(after)) - len(changed),
+    }
+
+    if segments:
+        old_segments = _segments(old, changed, fmt=fmt,
+                                 chunk_size=chunk_size)
+        new_segments = _segments(new, changed, fmt=fmt,
+                                 chunk_size=chunk_size)
+        report['segments'] = dict(
+            (uri, {'added': sorted(list(s) for s in
+                                   (new_segments[uri] - old_segments[uri])
+                                   .elements()),
+                   'removed': sorted(list(s) for s in
+                                     (old_segments[uri] - new_segments[uri])
+                                     .elements())})
+            for uri in changed)
+
+    return report
+
+
+def main(argv=None):
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Diff two versions of an annotation file.')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--format', default=None, dest='fmt')
+    parser.add_argument('--uris-only', action='store_true',
+                        help='do not report added and removed segments')
+    parser.add_argument('--report', default=None,
+                        help='path to JSON report (default: stdout)')
+    args = parser.parse_args(argv)
+
+    report = diff(args.old, args.new, fmt=args.fmt,
+                  segments=not args.uris_only)
+
+    if args.report is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    different = report['added'] or report['removed'] or report['changed']
+    return 1 if different else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
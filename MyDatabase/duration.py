@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Header-only audio duration probing
+
+Durations are read from container headers only (a few hundred bytes per
+file), without decoding any audio:
+
+  * WAV: 'fmt ' and 'data' chunks of RIFF (or RF64) container;
+  * FLAC: STREAMINFO metadata block;
+  * SPHERE: 'sample_count' and 'sample_rate' header fields.
+
+See `MyDatabase.audio.AudioIndex.durations` for parallel probing of many
+files, cached per uri.
+"""
+
+import io
+import struct
+import os.path as op
+
+# SPHERE headers are (at least) that long
+SPHERE_HEADER = 1024
+
+
+def _wav(f):
+
+    riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+    if riff not in (b'RIFF', b'RF64') or wave != b'WAVE':
+        raise ValueError('not a WAV file.')
+
+    block_align = sample_rate = data_size = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        chunk, size = struct.unpack('<4sI', header)
+        if chunk == b'ds64':
+            # RF64: actual 'data' size is stored here
+            _, data_size = struct.unpack('<QQ', f.read(16))
+            f.seek(size - 16 + size % 2, io.SEEK_CUR)
+        elif chunk == b'fmt ':
+            _, _, sample_rate, _, block_align = \
+                struct.unpack('<HHIIH', f.read(14))
+            f.seek(size - 14 + size % 2, io.SEEK_CUR)
+        elif chunk == b'data':
+            # in RF64 files, size is 0xFFFFFFFF and 'ds64' provides it
+            if riff == b'RIFF' and size != 0xFFFFFFFF:
+                data_size = size
+            if data_size is None:
+                # unknown size (e.g. streamed): data goes to end of file
+                data_size = op.getsize(f.name) - f.tell()
+            break
+        else:
+            f.seek(size + size % 2, io.SEEK_CUR)
+
+    if not block_align or not sample_rate or data_size is None:
+        raise ValueError('missing "fmt " or "data" chunk.')
+    return float(data_size // block_align) / sample_rate
+
+
+def _flac(f):
+
+    magic = f.read(4)
+    if magic[:3] == b'ID3':
+        # skip ID3v2 tag (synchsafe size)
+        header = f.read(6)
+        size = 0
+        for byte in bytearray(header[2:6]):
+            size = (size << 7) | (byte & 0x7F)
+        f.seek(size, io.SEEK_CUR)
+        magic = f.read(4)
+    if magic != b'fLaC':
+        raise ValueError('not a FLAC file.')
+
+    # STREAMINFO is always the first metadata block
+    header = bytearray(f.read(4))
+    if header[0] & 0x7F != 0:
+        raise ValueError('missing STREAMINFO block.')
+    info = bytearray(f.read(18))
+    # 20 bits sample rate | 3 bits channels | 5 bits bps | 36 bits samples
+    bits = int(''.join('{0:08b}'.format(byte) for byte in info[10:18]), 2)
+    sample_rate = bits >> 44
+    n_samples = bits & ((1 << 36) - 1)
+    if not sample_rate:
+        raise ValueError('invalid sample rate.')
+    return float(n_samples) / sample_rate
+
+
+def _sphere(f):
+
+    header = f.read(SPHERE_HEADER).decode('ascii', 'replace')
+    if not header.startswith('NIST_1A'):
+        raise ValueError('not a SPHERE file.')
+
+    fields = {}
+    for line in header.splitlines()[2:]:
+        if line.strip() == 'end_head':
+            break
+        tokens = line.split(None, 2)
+        if len(tokens) == 3:
+            fields[tokens[0]] = tokens[2]
+
+    try:
+        return float(int(fields['sample_count'])) / \
+            int(fields['sample_rate'])
+    except (KeyError, ValueError, ZeroDivisionError):
+        raise ValueError('missing "sample_count" or "sample_rate" field.')
+
+
+# container magic number -> header parser
+PROBES = ((b'RIFF', _wav), (b'RF64', _wav),
+          (b'fLaC', _flac), (b'ID3', _flac),
+          (b'NIST_1A', _sphere))
+
+
+def probe(path):
+    """Duration of audio file `path`, in seconds, read from its header
+
+    Raises
+    ------
+    ValueError
+        When format is not supported or header is invalid.
+    """
+
+    with io.open(path, 'rb') as f:
+        magic = f.read(8)
+        f.seek(0)
+        for prefix, parser in PROBES:
+            if magic.startswith(prefix):
+                try:
+                    return parser(f)
+                except struct.error:
+                    raise ValueError('{path}: truncated header.'.format(
+                        path=path))
+                except ValueError as e:
+                    raise ValueError('{path}: {error}'.format(path=path,
+                                                              error=e))
+
+    msg = '{path}: unsupported audio format (expected WAV, FLAC or SPHERE).'
+    raise ValueError(msg.format(path=path))
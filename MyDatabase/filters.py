@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Declarative segment filters
+
+Filters are dictionaries (e.g. from 'protocols.json' manifest) with any of
+the following keys, all of which must be satisfied for a segment to be kept:
+
+    {
+      "uris": "^first_",             # regular expression (or list of uris)
+      "labels": ["Alice", "Bob"],    # labels to keep
+      "exclude_labels": ["Ethan"],   # labels to remove
+      "min_duration": 0.5,           # in seconds
+      "max_duration": 30.0
+    }
+
+Filters are evaluated as vectorized masks over a `SegmentStore`.
+"""
+
+import re
+
+import numpy as np
+
+KEYS = {'uris', 'labels', 'exclude_labels', 'min_duration', 'max_duration'}
+
+
+def _labels(store, labels):
+    """Per-segment mask of segments whose label is in `labels`"""
+    known = np.isin(store.labels, np.asarray(list(labels), dtype=np.str_))
+    return known[store.label]
+
+
+def mask(store, filters):
+    """Boolean mask of segments of `store` satisfying `filters`"""
+
+    unknown = set(filters) - KEYS
+    if unknown:
+        msg = 'Unknown filters {unknown} (expected some of {keys}).'
+        raise ValueError(msg.format(unknown=sorted(unknown),
+                                    keys=sorted(KEYS)))
+
+    keep = np.ones(len(store), dtype=bool)
+
+    uris = filters.get('uris')
+    if uris is not None:
+        if isinstance(uris, (list, tuple)):
+            selected = np.isin(store.uris, np.asarray(uris, dtype=np.str_))
+        else:
+            # regular expression is only evaluated once per file
+            regex = re.compile(uris)
+            selected = np.array([regex.search(uri) is not None
+                                 for uri in store.uris.tolist()], dtype=bool)
+        keep &= selected[store.uri_index]
+
+    if filters.get('labels') is not None:
+        keep &= _labels(store, filters['labels'])
+
+    if filters.get('exclude_labels') is not None:
+        keep &= ~_labels(store, filters['exclude_labels'])
+
+    if filters.get('min_duration') is not None:
+        keep &= store.duration >= filters['min_duration']
+
+    if filters.get('max_duration') is not None:
+        keep &= store.duration <= filters['max_duration']
+
+    return keep
+
+
+def apply(store, filters):
+    """Subset of `store` satisfying `filters` (`store` itself if no filter)"""
+    if not filters:
+        return store
+    return store.subset(mask(store, filters))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Opt-in per-stage timing of protocol loading and iteration
+
+>>> protocol = get_protocol('MyDatabase.SpeakerDiarization.MyFirstProtocol')
+>>> protocol.instrument(callback)  # callback is optional
+>>> for current_file in protocol.train():
+...     pass
+>>> protocol.metrics()
+{'read': {'calls': 1, 'wall': 0.01, 'cpu': 0.01, 'items': 0, 'segments': 0},
+ 'tokenize': {...}, 'load': {...}, 'annotation': {...}, 'preprocess': {...}}
+
+Stages are:
+  * 'open': opening annotation files (file I/O);
+  * 'read': reading lines from annotation files (file I/O);
+  * 'tokenize': tokenizing lines into columns;
+  * 'load': loading a whole annotation file (including the above, or reading
+    from a compiled or cached store);
+  * 'cache': building the binary cache of an annotation file;
+  * 'spill': spilling an annotation file to disk (out-of-core mode);
+  * 'annotated': building 'annotated' timelines of a subset;
+  * 'annotation': building pyannote.core.Annotation of one item;
+  * 'preprocess': applying one preprocessor to one item (preprocessors
+    themselves are timed, as they may run lazily, e.g. when a field of the
+    item is first accessed).
+
+Instrumentation is disabled by default, in which case the only overhead is
+one `is None` test per stage. It is enabled automatically when stages are
+traced (see `MyDatabase.trace`).
+"""
+
+import time
+import threading
+
+try:
+    wall_time, process_time = time.perf_counter, time.process_time
+except AttributeError:
+    wall_time, process_time = time.time, time.clock
+
+
+class Stage(object):
+    """Context manager timing one occurrence of a stage
+
+    Set `items` and `segments` attributes to update stage counters.
+    """
+
+    __slots__ = ('metrics', 'name', 'items', 'segments', 'wall_', 'cpu_')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.items = 0
+        self.segments = 0
+
+    def __enter__(self):
+        self.wall_ = wall_time()
+        self.cpu_ = process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name,
+                            wall_time() - self.wall_,
+                            process_time() - self.cpu_,
+                            items=self.items, segments=self.segments,
+                            start=self.wall_)
+
+
+class Timed(object):
+    """Preprocessor timed as one occurrence of `stage`
+
+    Parameters
+    ----------
+    metrics : Metrics
+    stage : str
+    preprocessor : callable
+    """
+
+    def __init__(self, metrics, stage, preprocessor):
+        super(Timed, self).__init__()
+        self.metrics = metrics
+        self.stage = stage
+        self.preprocessor = preprocessor
+
+    def __call__(self, current_file):
+        with self.metrics.stage(self.stage) as stage:
+            stage.items = 1
+            return self.preprocessor(current_file)
+
+
+def untimed(preprocessor):
+    """Preprocessor wrapped by `Timed` (or `preprocessor` itself)"""
+    if isinstance(preprocessor, Timed):
+        return preprocessor.preprocessor
+    return preprocessor
+
+
+class Metrics(object):
+    """Per-stage wall/CPU time and item/segment counters
+
+    Parameters
+    ----------
+    callbacks : iterable of callable, optional
+        Called as callback(stage, wall, cpu, items, segments) every time a
+        stage completes.
+    tracer : MyDatabase.trace.Tracer, optional
+        Also record every stage as a trace span.
+    """
+
+    def __init__(self, callbacks=(), tracer=None):
+        super(Metrics, self).__init__()
+        self.callbacks = list(callbacks)
+        self.tracer = tracer
+        self.stages_ = {}
+        # stages may complete in several threads at once
+        self.lock_ = threading.Lock()
+
+    def stage(self, name):
+        """Time stage `name`
+
+        Usage
+        -----
+        >>> with metrics.stage('annotation') as stage:
+        ...     annotation = store.annotation(uri)
+        ...     stage.items, stage.segments = 1, len(annotation)
+        """
+        return Stage(self, name)
+
+    def record(self, name, wall, cpu, items=0, segments=0, start=None):
+        """Record one occurrence of stage `name`
+
+        `start` (see `wall_time`) is only needed for tracing.
+        """
+
+        with self.lock_:
+            stage = self.stages_.get(name)
+            if stage is None:
+                stage = self.stages_[name] = {'calls': 0, 'wall': 0.,
+                                              'cpu': 0., 'items': 0,
+                                              'segments': 0}
+            stage['calls'] += 1
+            stage['wall'] += wall
+            stage['cpu'] += cpu
+            stage['items'] += items
+            stage['segments'] += segments
+
+        for callback in self.callbacks:
+            callback(name, wall, cpu, items, segments)
+
+        if self.tracer is not None and start is not None:
+            self.tracer.span(name, start, wall,
+                             args={'items': items, 'segments': segments})
+
+    def snapshot(self):
+        """Copy of current per-stage metrics"""
+        with self.lock_:
+            return dict((name, dict(stage))
+                        for name, stage in self.stages_.items())
+
+    def reset(self):
+        self.stages_ = {}
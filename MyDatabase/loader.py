@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Process-wide memoization of parsed annotation files
+
+Stores are keyed on file path, size and modification time so that several
+protocols (or several iterations over the same protocol) share one parse.
+
+In watch mode (see `MyDatabase.watch`), watched files are rather keyed on
+the version that is currently served ("pinned"), so that changes are only
+visible once they are fully loaded. Use `snapshot` to resolve several files
+against the same set of versions.
+
+Memoized entries are thread-safe: each of them is built once, under its own
+lock (so that threads asking for the same file wait for one parse while
+other files load concurrently), and only published once complete. Built
+entries are then shared read-only, and looked up without taking any lock.
+"""
+
+import os
+import json
+import threading
+import os.path as op
+from contextlib import contextmanager
+
+from pyannote.core import Segment, Timeline
+
+from .parsers import read, CHUNK_SIZE
+from .memory import peak_rss
+from . import cache
+from . import compiled
+from . import spill
+from . import filters as _filters
+
+_STORES = {}
+_MEMORY = {}
+_OPTIONS = {}
+_FILTERED = {}
+_ANNOTATED = {}
+
+# (path, fmt) -> key of served version. never modified in place but replaced
+# as a whole (see `pin`), so that readers always see a consistent version
+_PINNED = {}
+_LOCAL = threading.local()
+
+# memo key -> lock held while building the corresponding entry
+_LOCKS = {}
+_LOCK = threading.Lock()
+
+
+def _key(path, fmt=None):
+    path = op.realpath(path)
+    pinned = getattr(_LOCAL, 'pinned', None)
+    if pinned is None:
+        pinned = _PINNED
+    key = pinned.get((path, fmt))
+    if key is not None:
+        return key
+    stat = os.stat(path)
+    return (path, fmt, stat.st_size, stat.st_mtime)
+
+
+@contextmanager
+def _building(key):
+    """Hold the lock of memo entry `key` (while building it)"""
+    with _LOCK:
+        lock = _LOCKS.get(key)
+        if lock is None:
+            lock = _LOCKS[key] = threading.Lock()
+    with lock:
+        yield
+
+
+@contextmanager
+def snapshot(pinned=None):
+    """Resolve files against one set of pinned versions (in this thread)
+
+    Parameters
+    ----------
+    pinned : dict, optional
+        Defaults to versions pinned when entering the context. Use {} to
+        resolve files against their current version on disk.
+    """
+    previous = getattr(_LOCAL, 'pinned', None)
+    _LOCAL.pinned = _PINNED if pinned is None else pinned
+    try:
+        yield
+    finally:
+        _LOCAL.pinned = previous
+
+
+def pin(keys):
+    """Pin versions of files (all at once)
+
+    Parameters
+    ----------
+    keys : iterable
+        Keys of versions to serve (None to serve current version on disk).
+    """
+    global _PINNED
+    keys = list(keys)
+    with _LOCK:
+        pinned = dict(_PINNED)
+        for key in keys:
+            pinned[key[:2]] = key
+        _PINNED = pinned
+
+
+def pinned():
+    """Pinned versions, as {(path, fmt): key} (read-only)"""
+    return _PINNED
+
+
+def unpin(files):
+    """Serve current version on disk of `files` (path, fmt) again"""
+    global _PINNED
+    files = list(files)
+    with _LOCK:
+        pinned = dict(_PINNED)
+        for path, fmt in files:
+            pinned.pop((op.realpath(path), fmt), None)
+        _PINNED = pinned
+
+
+def keys():
+    """Keys of loaded files"""
+    return list(_STORES)
+
+
+def evict(key):
+    """Forget loaded version `key` (and everything derived from it)
+
+    Stores that are still referenced (e.g. by running iterators) remain
+    valid.
+    """
+    for memo in (_STORES, _MEMORY, _OPTIONS, _LOCKS):
+        memo.pop(key, None)
+    for filtered in list(_FILTERED):
+        if filtered[0] == key:
+            _FILTERED.pop(filtered, None)
+            _LOCKS.pop(filtered, None)
+    for annotated in list(_ANNOTATED):
+        if key in annotated:
+            _ANNOTATED.pop(annotated, None)
+            _LOCKS.pop(annotated, None)
+
+
+def filters_of(key):
+    """Filters applied so far to loaded version `key`"""
+    return [json.loads(filters) for k, filters in list(_FILTERED)
+            if k == key]
+
+
+def options_of(key):
+    """Options (`out_of_core` and `chunk_size`) `key` was loaded with"""
+    return dict(_OPTIONS.get(key, {}))
+
+
+def has_annotated(key):
+    """Whether annotated regions of loaded version `key` were built"""
+    return any(annotated[0] == key for annotated in list(_ANNOTATED))
+
+
+def uem_path(path):
+    """Path to UEM sidecar of annotation file `path`"""
+    return op.splitext(path)[0] + '.uem'
+
+
+def load(path, fmt=None, metrics=None, out_of_core=False,
+         chunk_size=CHUNK_SIZE):
+    """Load annotation file `path` as a `SegmentStore`, parsing it only once
+
+    Uses the version compiled at build time when available (see
+    `MyDatabase.compiled`), or the binary cache when it is enabled (see
+    `MyDatabase.cache`).
+
+    When another process is building the cache and MYDATABASE_CACHE_WAIT=0,
+    the file is parsed by this process instead (and is not cached).
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.read`.
+    metrics : MyDatabase.instrument.Metrics, optional
+        Record time spent in 'load' stage (and 'read' and 'tokenize' stages
+        when the file is actually parsed).
+    out_of_core : bool, optional
+        Parse file out of core (see `MyDatabase.spill`), `chunk_size`
+        segments at a time, rather than in memory. Has no effect when the file
+        is already loaded.
+    """
+
+    key = _key(path, fmt=fmt)
+    store = _STORES.get(key)
+    if store is not None:
+        return store
+
+    with _building(key):
+
+        # another thread may have loaded it while we were waiting
+        store = _STORES.get(key)
+        if store is not None:
+            return store
+
+        before = peak_rss()
+
+        if metrics is None:
+            store = _load(path, fmt=fmt, out_of_core=out_of_core,
+                          chunk_size=chunk_size)
+        else:
+            with metrics.stage('load') as stage:
+                store = _load(path, fmt=fmt, metrics=metrics,
+                              out_of_core=out_of_core,
+                              chunk_size=chunk_size)
+                stage.segments = len(store)
+
+        _OPTIONS[key] = {'out_of_core': out_of_core,
+                         'chunk_size': chunk_size}
+        _MEMORY[key] = {'nbytes': store.nbytes,
+                        'resident': store.resident,
+                        'measured_peak': peak_rss() - before}
+        # published last, so that other threads never see it half loaded
+        _STORES[key] = store
+
+    return store
+
+
+def load_filtered(path, fmt=None, filters=None, metrics=None,
+                  out_of_core=False, chunk_size=CHUNK_SIZE):
+    """Load annotation file `path` and apply `filters`
+
+    Filtered stores are memoized as well, and all of them share the same
+    parsed (unfiltered) store: N protocols with different filters over the
+    same annotation file cost one parse.
+
+    Parameters
+    ----------
+    path : str
+    fmt : str, optional
+    metrics : MyDatabase.instrument.Metrics, optional
+    out_of_core : bool, optional
+    chunk_size : int, optional
+        See `load`.
+    filters : dict, optional
+        See `MyDatabase.filters`.
+    """
+
+    store = load(path, fmt=fmt, metrics=metrics, out_of_core=out_of_core,
+                 chunk_size=chunk_size)
+    if not filters:
+        return store
+
+    key = (_key(path, fmt=fmt), json.dumps(filters, sort_keys=True))
+    filtered = _FILTERED.get(key)
+    if filtered is None:
+        with _building(key):
+            filtered = _FILTERED.get(key)
+            if filtered is None:
+                # filtering memory-mapped (spilled) stores in memory would
+                # make them as resident as the whole annotation file
+                if out_of_core and store.directory_ is not None:
+                    filtered = spill.spill_filtered(
+                        path, store, filters, fmt=fmt,
+                        chunk_size=chunk_size, metrics=metrics)
+                else:
+                    filtered = _filters.apply(store, filters)
+                _FILTERED[key] = filtered
+    return filtered
+
+
+def share(path, fmt=None, filters=None):
+    """Move loaded annotation file `path` to shared memory
+
+    See `MyDatabase.shared.share`. Memoized store is replaced by its shared
+    version, so that the in-memory version can be freed.
+
+    Parameters
+    ----------
+    path : str
+    fmt : str, optional
+    filters : dict, optional
+        See `load_filtered`, which must have been called first.
+
+    Returns
+    -------
+    store : SegmentStore
+        Memory-mapped store.
+    """
+
+    from .shared import share as _share
+
+    key = _key(path, fmt=fmt)
+    memo = _STORES
+    if filters:
+        key, memo = (key, json.dumps(filters, sort_keys=True)), _FILTERED
+
+    with _building(key):
+        store = memo[key] = _share(memo[key])
+    return store
+
+
+def is_loaded(path, fmt=None):
+    """Whether annotation file `path` is already loaded"""
+    return _key(path, fmt=fmt) in _STORES
+
+
+def memory(path, fmt=None):
+    """Memory used by annotation file `path`
+
+    Returns
+    -------
+    memory : dict
+        'nbytes' is the size of the store, 'resident' how much of it is held
+        in memory (i.e. not memory-mapped), and 'measured_peak' by how much
+        loading it raised the process peak resident memory, in bytes.
+    """
+    return dict(_MEMORY.get(_key(path, fmt=fmt), {}))
+
+
+def _load(path, fmt=None, metrics=None, out_of_core=False,
+          chunk_size=CHUNK_SIZE):
+    store = compiled.load(path, fmt=fmt)
+    if store is None and cache.get_cache_dir() is not None:
+        # None when another process is building the cache and we do not wait
+        store = cache.load(path, fmt=fmt, metrics=metrics)
+    if store is None and out_of_core:
+        store = spill.spill(path, fmt=fmt, chunk_size=chunk_size,
+                            metrics=metrics)
+    if store is None:
+        store = read(path, fmt=fmt, chunk_size=chunk_size, metrics=metrics)
+    return store
+
+
+def load_annotated(path, fmt=None, metrics=None):
+    """Load annotated regions of every file of annotation file `path`
+
+    Annotated regions are read from UEM sidecar (same path with '.uem'
+    extension) when it exists. Files missing from the sidecar (or all files
+    when there is no sidecar) default to [0, end of last segment].
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.read`.
+    metrics : MyDatabase.instrument.Metrics, optional
+        Record time spent in 'annotated' stage.
+
+    Returns
+    -------
+    annotated : dict
+        Maps each uri to a pyannote.core.Timeline instance.
+    """
+
+    uem = uem_path(path)
+    key = (_key(path, fmt=fmt),
+           _key(uem, fmt='uem') if op.exists(uem) else None)
+
+    annotated = _ANNOTATED.get(key)
+    if annotated is not None:
+        return annotated
+
+    with _building(key):
+
+        annotated = _ANNOTATED.get(key)
+        if annotated is not None:
+            return annotated
+
+        annotations = load(path, fmt=fmt, metrics=metrics)
+        regions = None
+        if key[1] is not None:
+            regions = load(uem, fmt='uem', metrics=metrics)
+
+        if metrics is None:
+            annotated = _annotated(annotations, regions)
+        else:
+            with metrics.stage('annotated') as stage:
+                annotated = _annotated(annotations, regions)
+                stage.items = len(annotated)
+
+        _ANNOTATED[key] = annotated
+
+    return annotated
+
+
+def _annotated(annotations, uem=None):
+
+    annotated = {}
+    if uem is not None:
+        annotated.update(uem.timelines())
+
+    for uri, end in zip(annotations.uris.tolist(),
+                        annotations.extent().tolist()):
+        if uri not in annotated:
+            annotated[uri] = Timeline(segments=[Segment(0, end)], uri=uri)
+
+    return annotated
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Protocol manifest
+
+'protocols.json' lists every protocol of the database, grouped by task:
+
+    {
+      "SpeakerDiarization": {
+        "MyFirstProtocol": {
+          "class": ".protocol:MyProtocol1",
+          "subsets": {"train": ["protocol1.train.mdtm", "mdtm"]}
+        }
+      }
+    }
+
+where "class" is the protocol class (as "module:name", where modules starting
+with a dot are relative to this package, so that it can be renamed) and any
+other key (e.g. "subsets", "filters" or "max_memory") overrides the
+corresponding attribute.
+
+Protocols that only differ by a few attributes (typically "filters") can be
+declared as "variants" of a protocol, each variant being registered as a
+protocol of its own, with its attributes merged into the parent ones:
+
+    "MyFirstProtocol": {
+      "class": ".protocol:MyProtocol1",
+      "subsets": {"train": ["protocol1.train.mdtm", "mdtm"]},
+      "variants": {
+        "MyFirstProtocolShort": {"filters": {"max_duration": 2.0}},
+        "MyFirstProtocolNoBob": {"filters": {"exclude_labels": ["Bob"]}}
+      }
+    }
+
+All protocols reading the same annotation file share the same parsed store
+(see `MyDatabase.loader.load_filtered`). The manifest is read once per
+process, and protocol classes are only imported when first requested.
+"""
+
+import json
+import os.path as op
+from importlib import import_module
+
+MANIFEST = op.join(op.dirname(op.realpath(__file__)), 'protocols.json')
+
+_MANIFEST = {}
+_CLASSES = {}
+
+
+def load_manifest(path=MANIFEST):
+    """Load (and memoize) protocol manifest, with variants expanded"""
+
+    if path not in _MANIFEST:
+
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+
+        for task, protocols in manifest.items():
+            for name, entry in list(protocols.items()):
+                for variant, overrides in entry.pop('variants', {}).items():
+                    if variant in protocols:
+                        msg = 'Duplicate protocol "{task}.{name}".'
+                        raise ValueError(msg.format(task=task, name=variant))
+                    protocols[variant] = merge(entry, overrides)
+
+        _MANIFEST[path] = manifest
+
+    return _MANIFEST[path]
+
+
+def merge(entry, overrides):
+    """Merge variant `overrides` into parent `entry` (one level deep)"""
+    merged = dict(entry)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = dict(merged[key], **value)
+        merged[key] = value
+    return merged
+
+
+def resolve(task, name, entry):
+    """Get protocol class described by manifest `entry`"""
+
+    key = (task, name)
+    if key not in _CLASSES:
+
+        module, class_name = entry['class'].split(':')
+        protocol = getattr(import_module(module, __package__), class_name)
+
+        attributes = dict((key, value) for key, value in entry.items()
+                          if key != 'class')
+        if 'subsets' in attributes:
+            attributes['subsets'] = dict(
+                (subset, None if files is None else tuple(files))
+                for subset, files in attributes['subsets'].items())
+        if attributes:
+            # generated classes cannot be looked up by name: instances are
+            # pickled (e.g. for spawned DataLoader workers) by manifest entry
+            attributes['manifest_'] = (task, name, entry)
+            attributes['__reduce__'] = _reduce
+            protocol = type(str(name), (protocol, ), attributes)
+
+        _CLASSES[key] = protocol
+
+    return _CLASSES[key]
+
+
+def _reduce(protocol):
+    """Pickle instance of generated class by its manifest entry"""
+    getstate = getattr(protocol, '__getstate__', None)
+    state = protocol.__dict__ if getstate is None else getstate()
+    return (_rebuild, protocol.manifest_, state)
+
+
+def _rebuild(task, name, entry):
+    """Empty instance of protocol described by manifest `entry`"""
+    protocol = resolve(task, name, entry)
+    return protocol.__new__(protocol)
+
+
+class LazyProtocol(object):
+    """Stand-in for a protocol class, only imported when instantiated
+
+    Parameters
+    ----------
+    task, name : str
+        Task and protocol name.
+    entry : dict
+        Manifest entry.
+    """
+
+    def __init__(self, task, name, entry):
+        super(LazyProtocol, self).__init__()
+        self.task = task
+        self.name = name
+        self.entry = entry
+
+    def __call__(self, *args, **kwargs):
+        protocol = resolve(self.task, self.name, self.entry)
+        return protocol(*args, **kwargs)
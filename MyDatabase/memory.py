@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Memory accounting of annotation file loading
+
+Parsing an annotation file into a `SegmentStore` needs much more memory than
+the resulting store: per-chunk unicode columns (4 bytes per character of uri
+and label), their concatenation, and sorting buffers. `estimate` predicts
+both from a sample of the file; `peak_rss` measures the actual peak.
+"""
+
+import io
+import os
+import sys
+
+from .parsers import get_format, _is_data, CHUNK_SIZE
+
+# size of sample used for estimation
+SAMPLE_SIZE = 1 << 16
+
+# bytes per segment of a SegmentStore (start, duration, label)
+STORE_BYTES = 8 + 8 + 4
+
+UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size):
+    """Parse memory size such as 512M or 4G into a number of bytes
+
+    Returns None for None (or empty) `size`, i.e. no budget.
+    """
+    if size is None or isinstance(size, (int, float)):
+        return size
+    size = str(size).strip().upper().rstrip('B')
+    if not size:
+        return None
+    if size and size[-1] in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1]])
+    return int(size)
+
+
+def peak_rss():
+    """Peak resident memory of current process, in bytes"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def estimate(path, fmt=None, sample_size=SAMPLE_SIZE):
+    """Estimate memory needed to load annotation file `path`
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.read`.
+    sample_size : int, optional
+        Number of bytes used for estimation. Defaults to 64KB.
+
+    Returns
+    -------
+    estimate : dict
+        'segments' is the estimated number of segments, 'peak' the estimated
+        peak memory (in bytes) while parsing, 'resident' the estimated size
+        of the resulting store, and 'line' the estimated memory needed to
+        tokenize one line.
+    """
+
+    size = os.stat(path).st_size
+    with io.open(path, mode='r', encoding='utf-8') as f:
+        format_, _ = get_format(path, fmt=fmt).open(f)
+        sample = f.read(sample_size)
+
+    # ignore last (likely incomplete) line unless whole file was read
+    lines = sample.splitlines()
+    if len(sample) < sample_size:
+        n_bytes = max(1, len(sample.encode('utf-8')))
+    else:
+        lines = lines[:-1]
+        n_bytes = max(1, sum(len(l.encode('utf-8')) + 1 for l in lines))
+    # same comment filter as `MyDatabase.parsers.iter_chunks`
+    lines = [line.strip() for line in lines if _is_data(line.strip())]
+
+    columns = format_.tokenize(lines) if lines else None
+    if columns is None:
+        return {'segments': 0, 'peak': 0, 'resident': 0, 'line': 0}
+
+    segments = int(len(columns['start']) * float(size) / n_bytes)
+    text = columns['uri'].itemsize + columns['label'].itemsize
+
+    # chunks + their concatenation + uri/label codes and sort order
+    peak = segments * (2 * (text + 16) + 3 * 8 + STORE_BYTES)
+
+    # python strings of the chunk being tokenized (lines and fields)
+    fields = max(format_.n_fields, 4)
+    line = 64 * fields + 128 + n_bytes // len(lines) + 2 * (text + 16)
+    peak += min(segments, CHUNK_SIZE) * line
+
+    return {'segments': segments,
+            'peak': peak,
+            'resident': segments * STORE_BYTES,
+            'line': line}
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Chunked tokenizers for MDTM, RTTM, UEM and delimited (CSV/TSV) files
+
+All formats produce the same column chunks (uri, start, duration, label)
+that are then turned into a `MyDatabase.store.SegmentStore`.
+
+>>> from MyDatabase.parsers import read
+>>> store = read('protocol1.train.mdtm')
+>>> store.annotation('first_file')
+"""
+
+import io
+import csv
+import os.path as op
+from itertools import islice
+
+import numpy as np
+
+from .store import SegmentStore
+
+# number of lines tokenized at once
+CHUNK_SIZE = 100000
+
+FORMATS = {}
+
+
+def register_format(name, fmt):
+    """Make format `fmt` available as `name` (and its file extensions)"""
+    FORMATS[name] = fmt
+    return fmt
+
+
+def get_format(path, fmt=None):
+    """Get format by name, or guess it from `path` extension"""
+
+    if fmt is None:
+        _, ext = op.splitext(path)
+        for candidate in FORMATS.values():
+            if ext.lower() in candidate.extensions:
+                return candidate
+        msg = 'Could not guess format of "{path}".'
+        raise ValueError(msg.format(path=path))
+
+    try:
+        return FORMATS[fmt]
+    except KeyError:
+        msg = 'Unsupported format "{fmt}" (expected one of {formats}).'
+        raise ValueError(msg.format(fmt=fmt, formats=sorted(FORMATS)))
+
+
+class TokenizeError(ValueError):
+    """Raised when a chunk of lines cannot be tokenized
+
+    Parameters
+    ----------
+    message : str
+    index : int, optional
+        Index of offending line in chunk, when known.
+    """
+
+    def __init__(self, message, index=None):
+        super(TokenizeError, self).__init__(message)
+        self.index = index
+
+
+class LineFormat(object):
+    """Whitespace-delimited format with one segment per line
+
+    Parameters
+    ----------
+    n_fields : int
+        Minimum number of fields per line.
+    max_fields : int, optional
+        Maximum number of fields per line. Defaults to no maximum.
+    uri, start, duration, label : int
+        Index of corresponding field. `label` may be None.
+    end : int, optional
+        Index of end time field, when there is no `duration` field.
+    type_ : (int, str) tuple, optional
+        Only keep lines whose field at index type_[0] equals type_[1].
+    extensions : tuple, optional
+        File extensions used to guess the format.
+    """
+
+    def __init__(self, n_fields, uri=0, start=None, duration=None,
+                 label=None, end=None, type_=None, max_fields=None,
+                 extensions=()):
+        super(LineFormat, self).__init__()
+        self.n_fields = n_fields
+        self.max_fields = max_fields
+        self.uri = uri
+        self.start = start
+        self.duration = duration
+        self.label = label
+        self.end = end
+        self.type_ = type_
+        self.extensions = extensions
+
+    def split(self, lines):
+        return [line.split() for line in lines]
+
+    def open(self, f):
+        """Consume file header (if any)
+
+        Returns
+        -------
+        format : LineFormat
+            Format whose `tokenize` method should be used for this file.
+        n_lines : int
+            Number of header lines consumed.
+        """
+        return self, 0
+
+    def tokenize(self, lines):
+        """Tokenize a chunk of non-empty lines into columns
+
+        Parameters
+        ----------
+        lines : list of str
+
+        Returns
+        -------
+        columns : dict or None
+            'uri', 'start', 'duration' and 'label' np.ndarray, or None when
+            there is no segment (e.g. only non-'SPEAKER' RTTM lines).
+
+        Raises
+        ------
+        TokenizeError
+        """
+
+        rows = self.split(lines)
+        if not rows:
+            return None
+
+        lengths = set(len(row) for row in rows)
+        if min(lengths) < self.n_fields:
+            for i, row in enumerate(rows):
+                if len(row) < self.n_fields:
+                    msg = 'expected {n} fields, found {m}.'
+                    raise TokenizeError(
+                        msg.format(n=self.n_fields, m=len(row)), index=i)
+        if self.max_fields is not None and max(lengths) > self.max_fields:
+            for i, row in enumerate(rows):
+                if len(row) > self.max_fields:
+                    msg = 'expected at most {n} fields, found {m}.'
+                    raise TokenizeError(
+                        msg.format(n=self.max_fields, m=len(row)), index=i)
+
+        # transpose rows into columns -- this is where most of the time goes
+        fields = list(zip(*rows))
+
+        if self.type_ is not None:
+            index, value = self.type_
+            keep = np.array(fields[index], dtype=np.str_) == value
+            if not np.any(keep):
+                return None
+            if not np.all(keep):
+                fields = [np.array(field, dtype=np.str_)[keep]
+                          for field in fields]
+
+        try:
+            start = np.array(fields[self.start], dtype=np.float64)
+            if self.duration is None:
+                end = np.array(fields[self.end], dtype=np.float64)
+                duration = end - start
+            else:
+                duration = np.array(fields[self.duration], dtype=np.float64)
+        except ValueError as e:
+            raise TokenizeError(str(e))
+
+        uri = np.array(fields[self.uri], dtype=np.str_)
+        if self.label is None:
+            label = np.full(len(uri), u'', dtype=np.str_)
+        else:
+            label = np.array(fields[self.label], dtype=np.str_)
+
+        return {'uri': uri, 'start': start,
+                'duration': duration, 'label': label}
+
+
+class DelimitedFormat(LineFormat):
+    """Delimited format with a header line naming its columns
+
+    Header must contain 'uri' and 'start' columns, one of 'duration' or
+    'end' columns, and optionally a 'label' column.
+    """
+
+    def __init__(self, delimiter=',', extensions=(), **kwargs):
+        super(DelimitedFormat, self).__init__(
+            kwargs.pop('n_fields', 0), extensions=extensions, **kwargs)
+        self.delimiter = delimiter
+
+    def split(self, lines):
+        return list(csv.reader(lines, delimiter=self.delimiter))
+
+    def open(self, f):
+
+        header = next(csv.reader([f.readline()], delimiter=self.delimiter),
+                      [])
+        header = [column.strip() for column in header]
+
+        if not {'uri', 'start'} <= set(header) or \
+           not {'duration', 'end'} & set(header):
+            msg = ('Header must contain "uri", "start" and either "duration" '
+                   'or "end" columns (found {header}).')
+            raise ValueError(msg.format(header=header))
+
+        index = dict((column, i) for i, column in enumerate(header))
+        bound = DelimitedFormat(delimiter=self.delimiter,
+                                n_fields=len(header),
+                                max_fields=len(header),
+                                uri=index['uri'],
+                                start=index['start'],
+                                duration=index.get('duration'),
+                                end=None if 'duration' in index \
+                                    else index['end'],
+                                label=index.get('label'))
+        return bound, 1
+
+
+# uri channel start duration type confidence subtype label
+register_format('mdtm', LineFormat(
+    8, uri=0, start=2, duration=3, label=7, max_fields=8,
+    extensions=('.mdtm', )))
+
+# type uri channel start duration ortho stype label confidence [slat]
+register_format('rttm', LineFormat(
+    9, uri=1, start=3, duration=4, label=7, type_=(0, 'SPEAKER'),
+    max_fields=10, extensions=('.rttm', )))
+
+# uri channel start end
+register_format('uem', LineFormat(
+    4, uri=0, start=2, end=3, max_fields=4, extensions=('.uem', )))
+
+register_format('csv', DelimitedFormat(',', extensions=('.csv', )))
+register_format('tsv', DelimitedFormat('\t', extensions=('.tsv', )))
+
+
+def _is_data(line):
+    return line and not line.startswith(';;') and not line.startswith('#')
+
+
+def iter_chunks(path, fmt=None, chunk_size=CHUNK_SIZE, on_error=None,
+                metrics=None):
+    """Iterate over file `path` by chunks of at most `chunk_size` lines
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        One of 'mdtm', 'rttm', 'uem', 'csv' or 'tsv'.
+        Defaults to guessing it from `path` extension.
+    chunk_size : int, optional
+        Number of lines tokenized at once. Defaults to 100000.
+    on_error : callable, optional
+        When provided, malformed lines are skipped and reported by calling
+        on_error(line_number, message). Defaults to raising ValueError.
+    metrics : MyDatabase.instrument.Metrics, optional
+        Record time spent in 'open', 'read' and 'tokenize' stages.
+
+    Yields
+    ------
+    columns : dict
+        'uri', 'start', 'duration' and 'label' np.ndarray.
+    """
+
+    format_ = get_format(path, fmt=fmt)
+
+    if metrics is None:
+        f = io.open(path, mode='r', encoding='utf-8')
+    else:
+        with metrics.stage('open'):
+            f = io.open(path, mode='r', encoding='utf-8')
+
+    with f:
+
+        format_, lineno = format_.open(f)
+
+        while True:
+
+            if metrics is None:
+                chunk = list(islice(f, chunk_size))
+            else:
+                with metrics.stage('read'):
+                    chunk = list(islice(f, chunk_size))
+            if not chunk:
+                break
+
+            # skip empty lines and comments
+            lines = [line for line in (l.strip() for l in chunk)
+                     if _is_data(line)]
+
+            try:
+                if metrics is None:
+                    columns = format_.tokenize(lines)
+                else:
+                    with metrics.stage('tokenize') as stage:
+                        columns = format_.tokenize(lines)
+                        stage.segments = 0 if columns is None \
+                            else len(columns['start'])
+
+            except TokenizeError as e:
+
+                numbers = [lineno + 1 + i for i, l in enumerate(chunk)
+                           if _is_data(l.strip())]
+
+                if on_error is None:
+                    where = path
+                    if e.index is not None:
+                        where = '{path}, line {n}'.format(
+                            path=path, n=numbers[e.index])
+                    raise ValueError('{where}: {error}'.format(where=where,
+                                                               error=e))
+
+                # slow path: tokenize this chunk line by line
+                columns = _tokenize_lines(format_, lines, numbers, on_error)
+
+            lineno += len(chunk)
+
+            if columns is not None:
+                yield columns
+
+
+def _tokenize_lines(format_, lines, numbers, on_error):
+    """Tokenize lines one by one, reporting and skipping malformed ones"""
+
+    good = []
+    for line, number in zip(lines, numbers):
+        try:
+            format_.tokenize([line])
+        except TokenizeError as e:
+            on_error(number, str(e))
+        else:
+            good.append(line)
+
+    return format_.tokenize(good)
+
+
+def iter_uris(path, fmt=None, chunk_size=CHUNK_SIZE, metrics=None):
+    """Stream file `path` one uri at a time, in bounded memory
+
+    Segments of a given uri must be contiguous in the file.
+
+    See `iter_chunks` for a description of parameters.
+
+    Yields
+    ------
+    uri : str
+    store : SegmentStore
+        Segments of `uri`.
+
+    Raises
+    ------
+    ValueError
+        When segments of a given uri are not contiguous.
+    """
+
+    seen = set()
+    pending = []
+
+    for columns in iter_chunks(path, fmt=fmt, chunk_size=chunk_size,
+                               metrics=metrics):
+
+        uri = columns['uri']
+        if not len(uri):
+            continue
+
+        # index of first segment of each block of consecutive identical uris
+        starts = np.concatenate(
+            [[0], np.flatnonzero(uri[1:] != uri[:-1]) + 1, [len(uri)]])
+
+        for first, last in zip(starts[:-1].tolist(), starts[1:].tolist()):
+            block = dict((name, column[first:last])
+                         for name, column in columns.items())
+
+            # block continues the pending uri (across chunk boundary)
+            if pending and pending[0]['uri'][0] == block['uri'][0]:
+                pending.append(block)
+                continue
+
+            if pending:
+                yield _flush(pending, seen, path)
+            pending = [block]
+
+    if pending:
+        yield _flush(pending, seen, path)
+
+
+def _flush(blocks, seen, path):
+    uri = blocks[0]['uri'][0]
+    if uri in seen:
+        msg = '{path}: segments of "{uri}" are not contiguous.'
+        raise ValueError(msg.format(path=path, uri=uri))
+    seen.add(uri)
+    return str(uri), SegmentStore.from_chunks(blocks)
+
+
+def read(path, fmt=None, chunk_size=CHUNK_SIZE, metrics=None):
+    """Read file `path` into a columnar `SegmentStore`
+
+    See `iter_chunks` for a description of parameters.
+    """
+    return SegmentStore.from_chunks(
+        iter_chunks(path, fmt=fmt, chunk_size=chunk_size, metrics=metrics))
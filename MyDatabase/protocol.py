@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+import os
+import threading
+import os.path as op
+from pyannote.database.protocol import SpeakerDiarizationProtocol
+
+from . import DATA_DIR
+
+# subsets loading mode is decided once (see `MyProtocol1._mode`), even when
+# several threads start iterating over the same protocol at the same time
+_LOCK = threading.Lock()
+
+# this protocol defines a speaker diarization protocol: as such, a few methods
+# needs to be defined: trn_iter, dev_iter, and tst_iter.
+
+class MyProtocol1(SpeakerDiarizationProtocol):
+    """My first speaker diarization protocol """
+
+    # annotation file of each subset (relative to 'data' directory) and the
+    # format it is distributed in: 'mdtm', 'rttm', 'csv' or 'tsv' (or None to
+    # guess it from the file extension). use None for subsets that are not
+    # available. see MyDatabase.parsers for how to plug additional formats.
+    subsets = {
+        'train': ('protocol1.train.mdtm', 'mdtm'),
+        'development': None,
+        'test': None,
+    }
+
+    # only keep segments satisfying these filters (e.g. {'labels': ['Bob']}).
+    # see MyDatabase.filters for available filters. protocol variants that
+    # only differ by their filters are best declared in 'protocols.json'.
+    filters = None
+
+    # memory budget for loading a subset, in bytes (or as a string such as
+    # '4G'). when loading a subset into memory is estimated to need more than
+    # that, its annotation file is streamed one uri at a time instead (which
+    # requires segments of a given uri to be contiguous in the file).
+    # defaults to MYDATABASE_MAX_MEMORY environment variable, or no budget.
+    max_memory = None
+
+    # when True, subsets that do not fit in max_memory budget are spilled to
+    # a scratch directory (see MyDatabase.spill) and memory-mapped instead of
+    # being streamed: this needs disk space but, unlike streaming, works
+    # whatever the order of segments in the annotation file.
+    out_of_core = False
+
+    # path to a SQLite database (see MyDatabase.sql) into which annotation
+    # files are loaded once, and from which subsets are then streamed one uri
+    # at a time (in bounded memory, whatever the order of segments in the
+    # annotation file). this also enables ad-hoc queries (see `query`).
+    # defaults to MYDATABASE_SQLITE environment variable (or no database).
+    sqlite = None
+
+    # see `instrument`
+    metrics_ = None
+
+    def __init__(self, *args, **kwargs):
+        super(MyProtocol1, self).__init__(*args, **kwargs)
+        self.memory_ = {}
+
+    def __getstate__(self):
+        # instrumentation is per process: callbacks and tracer are not sent
+        # to (e.g. DataLoader worker) processes
+        state = dict(self.__dict__)
+        state.pop('metrics_', None)
+        if 'preprocessors' in state:
+            from .instrument import untimed
+            state['preprocessors'] = dict(
+                (key, untimed(preprocessor))
+                for key, preprocessor in state['preprocessors'].items())
+        return state
+
+    def memory(self):
+        """Memory report of each subset iterated over so far
+
+        Returns
+        -------
+        report : dict
+            Maps each subset to its loading 'mode' ('memory', 'streaming',
+            'out_of_core' -- in the last two cases 'chunk_size' is the
+            number of lines tokenized at once -- or 'sqlite'), its estimated
+            number of segments ('estimated_segments'), peak memory
+            ('estimated_peak'), resident memory ('estimated_resident') and
+            memory needed to tokenize one line ('estimated_line'), and, for
+            subsets loaded into memory, the actual size of the store
+            ('nbytes'), how much of it is resident ('resident') and by how
+            much loading raised the process peak resident memory
+            ('measured_peak'), all in bytes.
+        """
+        return dict((subset, dict(report))
+                    for subset, report in self.memory_.items())
+
+    def instrument(self, *callbacks):
+        """Enable per-stage timing instrumentation
+
+        Parameters
+        ----------
+        callbacks : callable
+            Called as callback(stage, wall, cpu, items, segments) every time
+            a stage completes. See MyDatabase.instrument for a list of stages.
+
+        Returns
+        -------
+        metrics : MyDatabase.instrument.Metrics
+        """
+        from .instrument import Metrics, Timed, untimed
+        from .trace import get_tracer
+        self.metrics_ = Metrics(callbacks=callbacks, tracer=get_tracer())
+
+        # preprocessors may run lazily (e.g. when a field of the item is
+        # first accessed), long after `preprocess` returned: they are
+        # therefore timed themselves
+        preprocessors = getattr(self, 'preprocessors', None) or {}
+        self.preprocessors = dict(
+            (key, Timed(self.metrics_, 'preprocess', untimed(preprocessor)))
+            for key, preprocessor in preprocessors.items())
+
+        return self.metrics_
+
+    def _metrics(self):
+        """Metrics recorder, or None when neither instrumented nor traced"""
+        if self.metrics_ is None and os.environ.get('MYDATABASE_TRACE'):
+            self.instrument()
+        return self.metrics_
+
+    def metrics(self):
+        """Snapshot of per-stage metrics ({} when not instrumented)"""
+        if self.metrics_ is None:
+            return {}
+        return self.metrics_.snapshot()
+
+    def _mode(self, subset, path, fmt):
+        """Decide (once) whether `subset` is loaded into memory or streamed
+
+        Returns
+        -------
+        report : dict
+            Memory report of `subset` (see `memory`).
+        """
+
+        from .loader import is_loaded
+        from .memory import estimate, parse_size
+        from .parsers import CHUNK_SIZE, TokenizeError
+
+        if self._database() is not None:
+            return self.memory_.setdefault(subset, {'mode': 'sqlite'})
+
+        # decided once and for all: no lock needed from then on
+        report = self.memory_.get(subset)
+        if report is not None:
+            return report
+
+        with _LOCK:
+
+            if subset in self.memory_ or is_loaded(path, fmt=fmt):
+                return self.memory_.setdefault(subset, {'mode': 'memory'})
+
+            try:
+                estimated = estimate(path, fmt=fmt)
+            except TokenizeError:
+                # malformed sample: loading will report (or skip) bad lines
+                return self.memory_.setdefault(subset, {'mode': 'memory'})
+
+            report = dict(('estimated_' + key, value)
+                          for key, value in estimated.items())
+            # empty MYDATABASE_MAX_MEMORY means no budget, as when unset
+            budget = parse_size(self.max_memory if self.max_memory is not None
+                                else os.environ.get('MYDATABASE_MAX_MEMORY')
+                                or None)
+            over = budget is not None and report['estimated_peak'] > budget
+            if not over:
+                report['mode'] = 'memory'
+            elif self.out_of_core:
+                report['mode'] = 'out_of_core'
+            else:
+                report['mode'] = 'streaming'
+            if over:
+                # tokenize small enough chunks to stay well within budget
+                report['chunk_size'] = int(min(CHUNK_SIZE, max(
+                    1000, budget // (4 * report['estimated_line']))))
+            self.memory_[subset] = report
+            return report
+
+    def _database(self):
+        """Path to SQLite database, or None"""
+        if self.sqlite is not None:
+            return self.sqlite
+        return os.environ.get('MYDATABASE_SQLITE') or None
+
+    def _stores(self, path, fmt, report, metrics=None):
+        """Stream annotation file one uri at a time
+
+        Yields
+        ------
+        uri : str
+        store : SegmentStore
+            Segments of `uri` (before filtering).
+        """
+
+        if report['mode'] == 'sqlite':
+            from .sql import SQLStore
+            database = SQLStore(self._database())
+            file_id = database.add(path, fmt=fmt, metrics=metrics)
+            return database.iter_uris(file_id)
+
+        from .parsers import iter_uris, CHUNK_SIZE
+        return iter_uris(path, fmt=fmt, metrics=metrics,
+                         chunk_size=report.get('chunk_size', CHUNK_SIZE))
+
+    def uris(self, subset):
+        """List of uris of `subset`, in iteration order
+
+        Cheaper than iterating over `subset` as no annotation is built.
+        """
+        return [uri for store in self._filtered(subset)
+                for uri in store.uris.tolist()]
+
+    def dataset(self, subset):
+        """Map-style dataset of `subset`, shared across worker processes
+
+        Segments live in memory-mapped buffers that (forked or spawned)
+        DataLoader workers attach to without copying, and items are built
+        (and preprocessed) on access. See `MyDatabase.shared`.
+
+        Subsets that would be streamed (see `max_memory` and `sqlite`) are
+        loaded out of core instead, as random access is needed.
+
+        Returns
+        -------
+        dataset : MyDatabase.shared.SubsetDataset
+            Supports len(dataset) and dataset[i] (in `uris` order).
+        """
+
+        import numpy as np
+        from .loader import load_filtered, load, uem_path, share, snapshot
+        from .parsers import CHUNK_SIZE
+        from .shared import SubsetDataset
+        from .store import SegmentStore
+
+        if self.subsets.get(subset) is None:
+            return SubsetDataset(self, SegmentStore.from_columns([], [], []))
+
+        path, fmt = self.subsets[subset]
+        path = op.join(DATA_DIR, path)
+        metrics = self._metrics()
+
+        report = self._mode(subset, path, fmt)
+        with snapshot():
+            load_filtered(path, fmt=fmt, filters=self.filters,
+                          metrics=metrics,
+                          out_of_core=report['mode'] != 'memory',
+                          chunk_size=report.get('chunk_size', CHUNK_SIZE))
+            store = share(path, fmt=fmt, filters=self.filters)
+
+            # default annotated regions end with the last segment of each
+            # file *before* filtering (as when iterating over the subset)
+            unfiltered = load(path, fmt=fmt, metrics=metrics)
+            extent = unfiltered.extent()[
+                np.searchsorted(unfiltered.uris, store.uris)]
+
+            regions = None
+            uem = uem_path(path)
+            if op.exists(uem):
+                load(uem, fmt='uem', metrics=metrics)
+                regions = share(uem, fmt='uem')
+
+        return SubsetDataset(self, store, regions=regions, extent=extent)
+
+    def durations(self, subset):
+        """Duration of audio file of each uri of `subset` (see `uris`)
+
+        Durations are read from audio file headers and cached (see
+        `MyDatabase.audio.AudioIndex.durations`), which requires the 'audio'
+        preprocessor to be a `MyDatabase.audio.AudioIndex`.
+
+        Returns
+        -------
+        durations : (n_uris, ) float64 np.ndarray
+            In seconds (NaN for missing or unreadable audio files), e.g. to
+            sample files in proportion to their duration.
+        """
+
+        from .audio import AudioIndex
+        from .instrument import untimed
+
+        audio = untimed(getattr(self, 'preprocessors', {}).get('audio'))
+        if not isinstance(audio, AudioIndex):
+            msg = ('Durations need "audio" preprocessor to be a '
+                   'MyDatabase.audio.AudioIndex instance.')
+            raise ValueError(msg)
+        return audio.durations(self.uris(subset))
+
+    def query(self, subset, **criteria):
+        """Query segments of `subset` from SQLite database (see `sqlite`)
+
+        Parameters
+        ----------
+        subset : {'train', 'development', 'test'}
+        uris, labels, start, end, min_duration, max_duration : optional
+            See `MyDatabase.sql.SQLStore.query`.
+
+        Returns
+        -------
+        columns : dict
+            'uri', 'start', 'duration' and 'label' np.ndarray, sorted by uri
+            and start time, restricted to protocol `filters`.
+        """
+
+        from .sql import SQLStore
+        from .store import SegmentStore
+        from .filters import apply
+
+        if self.subsets.get(subset) is None:
+            msg = 'Subset "{subset}" is not available.'
+            raise ValueError(msg.format(subset=subset))
+
+        path, fmt = self.subsets[subset]
+        path = op.join(DATA_DIR, path)
+
+        database = SQLStore(self._database())
+        file_id = database.add(path, fmt=fmt, metrics=self._metrics())
+        columns = database.query(files=file_id, **criteria)
+        if not self.filters:
+            return columns
+
+        return apply(SegmentStore.from_columns(**columns),
+                     self.filters).columns()
+
+    def _filtered(self, subset):
+        """Filtered segments of `subset`
+
+        Yields
+        ------
+        store : SegmentStore
+            One store for the whole subset when it is loaded in memory (or
+            out of core), one store per uri when it is streamed.
+        """
+
+        from .loader import load_filtered, snapshot
+        from .parsers import CHUNK_SIZE
+        from .filters import apply
+
+        if self.subsets.get(subset) is None:
+            return
+
+        path, fmt = self.subsets[subset]
+        path = op.join(DATA_DIR, path)
+        metrics = self._metrics()
+
+        report = self._mode(subset, path, fmt)
+        if report['mode'] in ('streaming', 'sqlite'):
+            for _, store in self._stores(path, fmt, report, metrics=metrics):
+                store = apply(store, self.filters)
+                if len(store):
+                    yield store
+            return
+
+        with snapshot():
+            store = load_filtered(
+                path, fmt=fmt, filters=self.filters, metrics=metrics,
+                out_of_core=report['mode'] == 'out_of_core',
+                chunk_size=report.get('chunk_size', CHUNK_SIZE))
+        yield store
+
+    def select(self, subset, expression):
+        """Segments of `subset` satisfying query `expression`
+
+        Parameters
+        ----------
+        subset : {'train', 'development', 'test'}
+        expression : MyDatabase.query.Expression
+            e.g. (col('duration') < 0.5) & col('label').isin(['Alice'])
+
+        Returns
+        -------
+        selected : MyDatabase.store.SegmentStore
+        """
+
+        from .query import select
+        from .store import SegmentStore
+
+        selected = [select(store, expression)
+                    for store in self._filtered(subset)]
+        if len(selected) == 1:
+            return selected[0]
+        return SegmentStore.from_chunks(store.columns() for store in selected)
+
+    def aggregate(self, subset, **aggregates):
+        """Group-by-uri aggregates of `subset`
+
+        Parameters
+        ----------
+        subset : {'train', 'development', 'test'}
+        **aggregates : MyDatabase.query.Aggregate
+            e.g. speech=col('duration').sum(), turns=count()
+
+        Returns
+        -------
+        result : dict
+            'uri' np.ndarray, and one (n_uris, ) np.ndarray per aggregate.
+        """
+
+        import numpy as np
+        from .query import aggregate
+        from .store import SegmentStore
+
+        results = [aggregate(store, **aggregates)
+                   for store in self._filtered(subset)]
+        if not results:
+            empty = SegmentStore.from_columns([], [], [], [])
+            return aggregate(empty, **aggregates)
+        if len(results) == 1:
+            return results[0]
+        return dict((name, np.concatenate([result[name]
+                                           for result in results]))
+                    for name in ['uri'] + list(aggregates))
+
+    def lookup(self, subset, uris=None, start=None, end=None):
+        """Segments of `uris` of `subset` overlapping [start, end]
+
+        Parameters
+        ----------
+        subset : {'train', 'development', 'test'}
+        uris, start, end : optional
+            See `MyDatabase.store.SegmentStore.lookup`.
+
+        Returns
+        -------
+        selected : MyDatabase.store.SegmentStore
+        """
+
+        from .store import SegmentStore
+
+        if uris is not None:
+            uris = list(uris)
+
+        selected = [store.lookup(uris=uris, start=start, end=end)
+                    for store in self._filtered(subset)]
+        if len(selected) == 1:
+            return selected[0]
+        return SegmentStore.from_chunks(store.columns() for store in selected)
+
+    def stats(self, subset):
+        """Summary statistics of `subset`
+
+        Returns
+        -------
+        stats : dict
+            Number of 'uris' and 'segments', total 'duration' (in seconds)
+            and, for each of the 'labels', its number of 'segments' and total
+            'duration'.
+        """
+
+        import numpy as np
+
+        stats = {'uris': 0, 'segments': 0, 'duration': 0., 'labels': {}}
+        for store in self._filtered(subset):
+            stats['uris'] += len(store.uris)
+            stats['segments'] += len(store)
+            counts = np.bincount(store.label, minlength=len(store.labels))
+            durations = np.bincount(store.label, weights=store.duration,
+                                    minlength=len(store.labels))
+            for label, count, duration in zip(store.labels.tolist(),
+                                              counts.tolist(),
+                                              durations.tolist()):
+                if not count:
+                    continue
+                entry = stats['labels'].setdefault(
+                    label, {'segments': 0, 'duration': 0.})
+                entry['segments'] += count
+                entry['duration'] += duration
+                stats['duration'] += duration
+        return stats
+
+    def _subset_iter(self, subset):
+
+        if self.subsets.get(subset) is None:
+            return
+
+        # heavy dependencies (numpy, pyannote.core) are only imported once
+        # a protocol is actually iterated over
+        from .loader import load_filtered, load_annotated, memory, snapshot
+        from .parsers import CHUNK_SIZE
+
+        path, fmt = self.subsets[subset]
+        path = op.join(DATA_DIR, path)
+        metrics = self._metrics()
+
+        report = self._mode(subset, path, fmt)
+
+        # note that when another process is caching the annotation file and
+        # we were told not to wait for it (MYDATABASE_CACHE_WAIT=0), it is
+        # loaded below all the same (parsed by this process, without being
+        # cached), so that files are yielded in the usual (sorted) order.
+        if report['mode'] in ('streaming', 'sqlite'):
+            stores = self._stores(path, fmt, report, metrics=metrics)
+            for current_file in self._stream_iter(path, stores,
+                                                  metrics=metrics):
+                yield current_file
+            return
+
+        # annotations and annotated regions come from the same version of
+        # annotation files, even when they are reloaded in the meantime (see
+        # MyDatabase.watch): iteration goes on over that version.
+        with snapshot():
+
+            # in this example, we assume annotations are distributed in MDTM
+            # format. annotations are loaded (only once per process) into a
+            # columnar store that provides pyannote.core.Annotation on demand
+            # (spilled to disk and memory-mapped in 'out_of_core' mode).
+            annotations = load_filtered(
+                path, fmt=fmt, filters=self.filters, metrics=metrics,
+                out_of_core=report['mode'] == 'out_of_core',
+                chunk_size=report.get('chunk_size', CHUNK_SIZE))
+            report.update(memory(path, fmt=fmt))
+            # size of the store actually served (i.e. once filtered)
+            report.update(nbytes=annotations.nbytes,
+                          resident=annotations.resident)
+
+            # an 'annotated' pyannote.core.Timeline instance containing the
+            # set of regions that were actually annotated (e.g. some files
+            # might only be partially annotated) is also built once for the
+            # whole subset: it is read from UEM sidecar file (e.g.
+            # 'protocol1.train.uem') when it exists, and defaults to [0, end
+            # of last segment] otherwise. this field can be used later to only
+            # evaluate those regions.
+            annotated = load_annotated(path, fmt=fmt, metrics=metrics)
+
+        # iterate over each file of the subset (in sorted order)
+        for uri in annotations.uris.tolist():
+            annotation = self._annotation(annotations, uri, metrics=metrics)
+            yield self._item(uri, annotation, annotated[uri])
+
+    def _stream_iter(self, path, stores, metrics=None):
+        """Same as _subset_iter, streaming annotation file one uri at a time
+
+        Parameters
+        ----------
+        path : str
+            Path to annotation file.
+        stores : iterable
+            (uri, store) pairs (see `_stores`).
+        """
+
+        from pyannote.core import Segment, Timeline
+        from .loader import load, uem_path
+        from .filters import apply
+
+        # UEM sidecar files are small enough to always be loaded
+        uem = uem_path(path)
+        regions = load(uem, fmt='uem', metrics=metrics) \
+            if op.exists(uem) else None
+
+        # files come in the same order as in the annotation file (or in uri
+        # order when streamed from SQLite database)
+        for uri, store in stores:
+            if regions is not None and uri in regions:
+                annotated = regions.timeline(uri)
+            else:
+                end = float(store.extent()[0])
+                annotated = Timeline(segments=[Segment(0, end)], uri=uri)
+
+            store = apply(store, self.filters)
+            if not len(store):
+                continue
+
+            annotation = self._annotation(store, uri, metrics=metrics)
+            yield self._item(uri, annotation, annotated)
+
+    def _annotation(self, store, uri, metrics=None):
+        """Get annotations as pyannote.core.Annotation instance"""
+        if metrics is None:
+            return store.annotation(uri)
+        with metrics.stage('annotation') as stage:
+            annotation = store.annotation(uri)
+            stage.items, stage.segments = 1, len(annotation)
+        return annotation
+
+    def _item(self, uri, annotation, annotated):
+
+        # `trn_iter` (as well as `dev_iter` and `tst_iter`) are expected
+        # to yield dictionary with the following fields:
+        return {
+            # name of the database class
+            'database': 'MyDatabase',
+            # unique file identifier
+            'uri': uri,
+            # reference as pyannote.core.Annotation instance
+            'annotation': annotation,
+            # annotated regions as pyannote.core.Timeline instance
+            'annotated': annotated,
+        }
+
+    def trn_iter(self):
+        return self._subset_iter('train')
+
+    def dev_iter(self):
+        return self._subset_iter('development')
+
+    def tst_iter(self):
+        return self._subset_iter('test')
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Local HTTP annotation server
+
+Usage: python -m MyDatabase.server [--host=<host>] [--port=<port>]
+
+Serves MyDatabase protocols from one warm process (annotation files are only
+parsed once), so that lightweight tools can look annotations up without
+importing pyannote.database nor parsing anything themselves:
+
+  GET  /protocols
+       {"SpeakerDiarization": ["MyFirstProtocol", ...]}
+  GET  /protocols/<task>
+       {"protocols": ["MyFirstProtocol", ...]}
+  GET  /protocols/<task>/<protocol>
+       {"subsets": ["train"]}
+  GET  /protocols/<task>/<protocol>/<subset>/uris
+       {"uris": ["uri1", "uri2", ...]}
+  GET  /protocols/<task>/<protocol>/<subset>/stats
+       {"uris": 2, "segments": 10, "duration": 42.0, "labels": {...}}
+  GET  /protocols/<task>/<protocol>/<subset>/annotations?uri=a&uri=b&end=60
+  POST /protocols/<task>/<protocol>/<subset>/annotations
+       {"uris": ["a", "b"], "start": 0, "end": 60}
+
+'annotations' parameters are all optional: several uris can be looked up at
+once (defaults to all uris, use POST for large batches), and segments can be
+restricted to those overlapping [start, end]. Files without any (matching)
+segment are left out of the response, which is either JSON...
+
+  {"uris": {"a": {"start": [...], "duration": [...], "label": [...]}, ...}}
+
+... or, when requested with 'Accept: application/octet-stream' header (or
+'format=npz' parameter), a compact (uncompressed) .npz archive of the
+`SegmentStore` columns, to be decoded with `loads`.
+
+Connections are kept alive (HTTP/1.1), and each one is served by its own
+thread.
+"""
+
+import io
+import sys
+import json
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs, unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+    from urllib import unquote
+
+import numpy as np
+
+from .store import SegmentStore, COLUMNS
+
+HOST = '127.0.0.1'
+PORT = 8000
+
+SUBSETS = ('train', 'development', 'test')
+
+JSON = 'application/json'
+BINARY = 'application/octet-stream'
+
+
+def dumps(store):
+    """Encode `store` as (uncompressed) .npz archive"""
+    buffer = io.BytesIO()
+    np.savez(buffer, **dict((column, getattr(store, column))
+                            for column in COLUMNS))
+    return buffer.getvalue()
+
+
+def loads(data):
+    """Decode binary 'annotations' response
+
+    >>> store = loads(response.read())
+    >>> annotation = store.annotation(uri)
+    """
+    with np.load(io.BytesIO(data)) as archive:
+        return SegmentStore(*[archive[column] for column in COLUMNS])
+
+
+def to_json(store):
+    """JSON-serializable segments of `store`, grouped by uri"""
+    start = store.start.tolist()
+    duration = store.duration.tolist()
+    label = store.labels[store.label].tolist()
+    offsets = store.offsets.tolist()
+    return {'uris': dict(
+        (uri, {'start': start[offsets[i]:offsets[i + 1]],
+               'duration': duration[offsets[i]:offsets[i + 1]],
+               'label': label[offsets[i]:offsets[i + 1]]})
+        for i, uri in enumerate(store.uris.tolist()))}
+
+
+class HTTPError(Exception):
+    """Error reported to client with HTTP `status`"""
+
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Route requests to the protocols of the server database"""
+
+    # keep-alive: every response comes with its Content-Length
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle({})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        try:
+            params = json.loads(body.decode('utf-8')) if body else {}
+        except ValueError:
+            return self._send(400, {'error': 'Invalid JSON body.'})
+        if not isinstance(params, dict):
+            return self._send(400, {'error': 'Expected a JSON object.'})
+        self._handle(params)
+
+    def _send(self, status, body, content_type=JSON):
+        if content_type == JSON:
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, params):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+        try:
+            status, body, content_type = 200, None, JSON
+            body = self._route(parts, query, params)
+            if isinstance(body, SegmentStore):
+                body, content_type = self._annotations(body, query, params)
+        except HTTPError as e:
+            status, body = e.status, {'error': str(e)}
+        except Exception as e:
+            status, body = 500, {'error': str(e)}
+        self._send(status, body, content_type=content_type)
+
+    def _route(self, parts, query, params):
+
+        database = self.server.database
+        if not parts or parts[0] != 'protocols' or len(parts) == 4 or \
+                len(parts) > 5:
+            raise HTTPError(404, 'Unknown path.')
+
+        if len(parts) == 1:
+            return dict((task, database.get_protocols(task))
+                        for task in database.get_tasks())
+
+        task = parts[1]
+        if task not in database.get_tasks():
+            raise HTTPError(404, 'Unknown task "{0}".'.format(task))
+
+        if len(parts) == 2:
+            return {'protocols': database.get_protocols(task)}
+
+        protocol = self.server.protocol(task, parts[2])
+        subsets = getattr(protocol, 'subsets', {})
+        if len(parts) == 3:
+            return {'subsets': [subset for subset in SUBSETS
+                                if subsets.get(subset) is not None]}
+
+        subset, resource = parts[3:]
+        if subsets.get(subset) is None:
+            raise HTTPError(404, 'Unknown subset "{0}".'.format(subset))
+
+        if resource == 'uris':
+            return {'uris': protocol.uris(subset)}
+
+        if resource == 'stats':
+            return protocol.stats(subset)
+
+        if resource == 'annotations':
+            uris = params.get('uris', [])
+            if not isinstance(uris, list) or \
+                    not all(isinstance(uri, type(u'')) for uri in uris):
+                raise HTTPError(400, '"uris" must be a list of strings.')
+            uris = query.get('uri', []) + uris
+            return protocol.lookup(subset, uris=uris or None,
+                                   start=self._time('start', query, params),
+                                   end=self._time('end', query, params))
+
+        raise HTTPError(404, 'Unknown resource "{0}".'.format(resource))
+
+    def _time(self, name, query, params):
+        value = params.get(name, query.get(name, [None])[-1])
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise HTTPError(400, 'Invalid "{0}" parameter.'.format(name))
+
+    def _annotations(self, store, query, params):
+        fmt = params.get('format', query.get('format', [None])[-1])
+        if fmt is None:
+            accept = self.headers.get('Accept') or ''
+            fmt = 'npz' if BINARY in accept else 'json'
+        if fmt == 'npz':
+            return dumps(store), BINARY
+        if fmt == 'json':
+            return to_json(store), JSON
+        raise HTTPError(400, 'Unknown format "{0}".'.format(fmt))
+
+
+class AnnotationServer(ThreadingMixIn, HTTPServer):
+    """HTTP server fronting one (warm) MyDatabase instance
+
+    Parameters
+    ----------
+    address : (host, port) tuple
+    database : MyDatabase, optional
+        Defaults to a new MyDatabase instance.
+
+    Usage
+    -----
+    >>> server = AnnotationServer(('127.0.0.1', 8000))
+    >>> server.warm()
+    >>> server.serve_forever()
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, database=None):
+        HTTPServer.__init__(self, address, Handler)
+        if database is None:
+            from .database import MyDatabase
+            database = MyDatabase()
+        self.database = database
+        self.protocols_ = {}
+        self.lock_ = threading.Lock()
+
+    def protocol(self, task, name):
+        """Get (and memoize) protocol `name` of `task`"""
+        key = (task, name)
+        with self.lock_:
+            if key not in self.protocols_:
+                try:
+                    protocol = self.database.get_protocol(task, name)
+                except KeyError:
+                    msg = 'Unknown protocol "{0}".'.format(name)
+                    raise HTTPError(404, msg)
+                self.protocols_[key] = protocol
+            return self.protocols_[key]
+
+    def warm(self):
+        """Load every subset of every protocol ahead of the first request"""
+        for task in self.database.get_tasks():
+            for name in self.database.get_protocols(task):
+                protocol = self.protocol(task, name)
+                for subset in SUBSETS:
+                    if getattr(protocol, 'subsets', {}).get(subset) is None:
+                        continue
+                    protocol.stats(subset)
+
+
+def main(argv=None):
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Serve MyDatabase annotations over HTTP.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', default=PORT, type=int)
+    parser.add_argument('--lazy', action='store_true',
+                        help='load subsets on first request only')
+    args = parser.parse_args(argv)
+
+    server = AnnotationServer((args.host, args.port))
+    if not args.lazy:
+        server.warm()
+
+    sys.stderr.write('Serving on http://{host}:{port}/protocols\n'.format(
+        host=args.host, port=server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Zero-copy sharing of protocol data across worker processes
+
+>>> dataset = protocol.dataset('train')
+>>> loader = torch.utils.data.DataLoader(dataset, num_workers=16,
+...                                      collate_fn=lambda files: files)
+
+`MyProtocol1.dataset` returns a map-style dataset whose segments live in
+memory-mapped columnar buffers: the compiled, cached or spilled store when
+there is one, or a copy of the parsed store in shared memory ('/dev/shm')
+otherwise. Worker processes attach to those buffers without copying them,
+whether they are forked (pages are read-only, hence never duplicated by
+copy-on-write) or spawned (stores are pickled by reference, see
+`SegmentStore.__reduce__`). Per-item objects (pyannote.core.Annotation and
+Timeline) are only built on access, inside each worker: memory stays flat
+as the number of workers grows.
+"""
+
+import os
+import atexit
+import shutil
+import tempfile
+import os.path as op
+
+import numpy as np
+
+from .store import SegmentStore
+
+# shared memory filesystem, when available
+SHM_DIR = '/dev/shm' if op.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _remove(directory, pid):
+    # forked children inherit atexit handlers: only the owner cleans up
+    if os.getpid() == pid:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def share(store):
+    """Memory-mapped version of `store`
+
+    Stores that are already memory-mapped are returned as is. Others are
+    copied into a shared memory directory, removed when the process exits.
+    """
+
+    if store.directory_ is not None:
+        return store
+
+    directory = tempfile.mkdtemp(dir=SHM_DIR, prefix='MyDatabase.')
+    atexit.register(_remove, directory, os.getpid())
+    store.save(directory)
+    return SegmentStore.load(directory)
+
+
+class SubsetDataset(object):
+    """Map-style dataset of protocol files (see `MyProtocol1.dataset`)
+
+    Parameters
+    ----------
+    protocol : MyProtocol1
+        Used to build (and preprocess) items.
+    store : SegmentStore
+        Filtered segments of the subset (preferably memory-mapped).
+    regions : SegmentStore, optional
+        Annotated regions (from UEM sidecar).
+    extent : (n_uris, ) float64 np.ndarray, optional
+        End of last segment of each file, before filtering, used as default
+        annotated regions. Defaults to `store.extent()`.
+    """
+
+    def __init__(self, protocol, store, regions=None, extent=None):
+        super(SubsetDataset, self).__init__()
+        self.protocol = protocol
+        self.store = store
+        self.regions = regions
+        self.extent = extent
+
+    def __len__(self):
+        return len(self.store.uris)
+
+    @property
+    def uris(self):
+        return self.store.uris
+
+    def _annotated(self, i, uri):
+        from pyannote.core import Segment, Timeline
+        if self.regions is not None and uri in self.regions:
+            return self.regions.timeline(uri)
+        if self.extent is None:
+            self.extent = self.store.extent()
+        return Timeline(segments=[Segment(0, float(self.extent[i]))],
+                        uri=uri)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)) and i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        uri = str(self.store.uris[i])
+        metrics = self.protocol._metrics()
+        annotation = self.protocol._annotation(self.store, uri,
+                                               metrics=metrics)
+        current_file = self.protocol._item(uri, annotation,
+                                           self._annotated(i, uri))
+        return self.protocol.preprocess(current_file)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Out-of-core loading of annotation files
+
+Annotation files too large to be parsed in memory are spilled to a scratch
+directory (MYDATABASE_SCRATCH environment variable, defaulting to a
+'MyDatabase' subdirectory of the system temporary directory) as a
+memory-mapped `SegmentStore`:
+
+  1. chunks of tokenized lines are appended to raw column files, uris and
+     labels being replaced by integer codes on the fly;
+  2. segments are scattered (counting sort) into their final position in
+     memory-mapped .npy columns, chunk by chunk;
+  3. segments of each file are sorted by start time, block by block.
+
+Peak memory is therefore bounded by the chunk size (plus the number of
+distinct uris and labels) rather than by the size of the annotation file.
+Like the binary cache (see `MyDatabase.cache`), spilled stores are keyed on
+file path, size and modification time, built by only one process at a time,
+and reused across processes.
+
+Filtered versions of spilled stores (see `MyDatabase.filters`) are spilled
+as well, block by block (see `spill_filtered`), so that they do not end up
+fully resident either.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import os.path as op
+
+import numpy as np
+
+from .parsers import iter_chunks, CHUNK_SIZE
+from .store import SegmentStore, blocks
+from .cache import cache_path, lock, makedirs
+
+SCRATCH_ENV = 'MYDATABASE_SCRATCH'
+
+# raw (i.e. unsorted) columns and their dtype
+RAW = (('uri', np.int32), ('start', np.float64),
+       ('duration', np.float64), ('label', np.int32))
+
+
+def get_scratch_dir():
+    """Scratch directory where annotation files are spilled"""
+    return os.environ.get(SCRATCH_ENV) or \
+        op.join(tempfile.gettempdir(), 'MyDatabase')
+
+
+def _encode(values, vocabulary):
+    """Replace strings by integer codes, extending `vocabulary` as needed
+
+    Parameters
+    ----------
+    values : (n, ) unicode np.ndarray
+    vocabulary : dict
+        Maps strings to codes, in order of first appearance.
+
+    Returns
+    -------
+    codes : (n, ) int32 np.ndarray
+    """
+    unique, inverse = np.unique(values, return_inverse=True)
+    codes = np.empty(len(unique), dtype=np.int32)
+    for i, value in enumerate(unique.tolist()):
+        codes[i] = vocabulary.setdefault(value, len(vocabulary))
+    return codes[inverse]
+
+
+def _rank(vocabulary):
+    """Sort `vocabulary`
+
+    Returns
+    -------
+    values : unicode np.ndarray
+        Sorted values.
+    rank : int32 np.ndarray
+        Maps codes to their index into `values`.
+    """
+    values = np.array(sorted(vocabulary, key=vocabulary.get), dtype=np.str_)
+    order = np.argsort(values, kind='stable')
+    rank = np.empty(len(values), dtype=np.int32)
+    rank[order] = np.arange(len(values), dtype=np.int32)
+    return values[order], rank
+
+
+def _spill(path, directory, fmt=None, chunk_size=CHUNK_SIZE, metrics=None):
+    """Spill annotation file `path` as a `SegmentStore` into `directory`"""
+
+    # 1. append tokenized chunks to raw column files
+    uris, labels = {}, {}
+    counts = np.zeros(0, dtype=np.int64)
+    raw = dict((column, op.join(directory, column + '.raw'))
+               for column, _ in RAW)
+    files = dict((column, open(raw[column], 'wb')) for column, _ in RAW)
+    try:
+        for columns in iter_chunks(path, fmt=fmt, chunk_size=chunk_size,
+                                   metrics=metrics):
+            uri = _encode(columns['uri'], uris)
+            label = _encode(columns['label'], labels)
+            chunk = {'uri': uri, 'start': columns['start'],
+                     'duration': columns['duration'], 'label': label}
+            for column, dtype in RAW:
+                np.asarray(chunk[column], dtype=dtype).tofile(files[column])
+            counts = np.pad(counts, (0, len(uris) - len(counts)),
+                            mode='constant')
+            counts += np.bincount(uri, minlength=len(uris))
+    finally:
+        for f in files.values():
+            f.close()
+
+    uris, uri_rank = _rank(uris)
+    labels, label_rank = _rank(labels)
+    if len(labels) == 0:
+        labels = np.array([], dtype=np.str_)
+
+    counts = counts[np.argsort(uri_rank)]
+    offsets = np.zeros(len(uris) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    n_segments = int(offsets[-1])
+
+    np.save(op.join(directory, 'uris.npy'), uris)
+    np.save(op.join(directory, 'offsets.npy'), offsets)
+    np.save(op.join(directory, 'labels.npy'), labels)
+
+    # 2. scatter segments into their final (uri) position, chunk by chunk
+    sources = dict((column, np.memmap(raw[column], dtype=dtype, mode='r')
+                    if n_segments else np.zeros(0, dtype=dtype))
+                   for column, dtype in RAW)
+    targets = dict(
+        (column, np.lib.format.open_memmap(
+            op.join(directory, column + '.npy'), mode='w+',
+            dtype=dtype, shape=(n_segments, )))
+        for column, dtype in RAW if column != 'uri')
+
+    cursor = offsets[:-1].copy()
+    for lo in range(0, n_segments, chunk_size):
+        hi = min(lo + chunk_size, n_segments)
+        uri = uri_rank[sources['uri'][lo:hi]]
+        order = np.argsort(uri, kind='stable')
+        uri = uri[order]
+        # rank of each segment among segments of the same file in this chunk
+        within = np.arange(hi - lo) - np.searchsorted(uri, uri)
+        position = cursor[uri] + within
+        targets['start'][position] = sources['start'][lo:hi][order]
+        targets['duration'][position] = sources['duration'][lo:hi][order]
+        targets['label'][position] = label_rank[sources['label'][lo:hi]][order]
+        cursor += np.bincount(uri, minlength=len(uris))
+
+    # 3. sort segments of each file by start time, block by block
+    for first, last in blocks(offsets, chunk_size):
+        lo, hi = offsets[first], offsets[last]
+        uri = np.repeat(np.arange(last - first),
+                        np.diff(offsets[first:last + 1]))
+        order = np.lexsort((targets['start'][lo:hi], uri))
+        for target in targets.values():
+            target[lo:hi] = target[lo:hi][order]
+
+    for target in targets.values():
+        target.flush()
+    del sources, targets
+    for column in raw.values():
+        os.remove(column)
+
+
+def spill(path, fmt=None, scratch_dir=None, chunk_size=CHUNK_SIZE,
+          metrics=None):
+    """Load annotation file `path` out of core, spilling it first if needed
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    fmt : str, optional
+        See `MyDatabase.parsers.read`.
+    scratch_dir : str, optional
+        Defaults to MYDATABASE_SCRATCH environment variable.
+    chunk_size : int, optional
+        Number of segments processed at once.
+    metrics : MyDatabase.instrument.Metrics, optional
+        Record time spent in 'spill' stage (and parsing stages, see
+        `MyDatabase.parsers.iter_chunks`).
+
+    Returns
+    -------
+    store : SegmentStore
+        Memory-mapped store.
+    """
+
+    if scratch_dir is None:
+        scratch_dir = get_scratch_dir()
+
+    target = cache_path(path, fmt=fmt, cache_dir=scratch_dir)
+    if op.isdir(target):
+        return SegmentStore.load(target)
+
+    makedirs(scratch_dir)
+
+    def build(directory):
+        _spill(path, directory, fmt=fmt, chunk_size=chunk_size,
+               metrics=metrics)
+
+    # only one process spills a given file (see `MyDatabase.cache.lock`)
+    with lock(target):
+        if not op.isdir(target):
+            _publish(target, scratch_dir, build, metrics=metrics)
+
+    return SegmentStore.load(target)
+
+
+def _filter(store, filters, directory, chunk_size=CHUNK_SIZE):
+    """Save segments of `store` satisfying `filters` into `directory`"""
+
+    from .filters import mask
+
+    def masks():
+        # memory-mapped columns are only read one block at a time
+        for first, last in blocks(store.offsets, chunk_size):
+            lo, hi = store.offsets[first], store.offsets[last]
+            block = SegmentStore(
+                store.uris[first:last], store.offsets[first:last + 1] - lo,
+                store.start[lo:hi], store.duration[lo:hi],
+                store.label[lo:hi], store.labels)
+            yield first, last, block, mask(block, filters)
+
+    # 1. count segments kept in each file
+    counts = np.zeros(len(store.uris), dtype=np.int64)
+    for first, last, block, keep in masks():
+        counts[first:last] = np.bincount(block.uri_index[keep],
+                                         minlength=last - first)
+
+    # files left without any segment are removed (as in `SegmentStore.subset`)
+    offsets = np.zeros(np.sum(counts > 0) + 1, dtype=np.int64)
+    np.cumsum(counts[counts > 0], out=offsets[1:])
+    n_segments = int(offsets[-1])
+
+    np.save(op.join(directory, 'uris.npy'), store.uris[counts > 0])
+    np.save(op.join(directory, 'offsets.npy'), offsets)
+    np.save(op.join(directory, 'labels.npy'), store.labels)
+
+    columns = ('start', 'duration', 'label')
+    if not n_segments:
+        for column in columns:
+            np.save(op.join(directory, column + '.npy'),
+                    getattr(store, column)[:0])
+        return
+
+    # 2. copy kept segments, block by block (order is preserved)
+    targets = dict(
+        (column, np.lib.format.open_memmap(
+            op.join(directory, column + '.npy'), mode='w+',
+            dtype=getattr(store, column).dtype, shape=(n_segments, )))
+        for column in columns)
+    cursor = 0
+    for _, _, block, keep in masks():
+        n = int(np.sum(keep))
+        for column, target in targets.items():
+            target[cursor:cursor + n] = getattr(block, column)[keep]
+        cursor += n
+
+    for target in targets.values():
+        target.flush()
+
+
+def spill_filtered(path, store, filters, fmt=None, scratch_dir=None,
+                   chunk_size=CHUNK_SIZE, metrics=None):
+    """Spill segments of annotation file `path` satisfying `filters`
+
+    Parameters
+    ----------
+    path : str
+        Path to annotation file.
+    store : SegmentStore
+        Store of annotation file `path` (preferably memory-mapped, e.g. as
+        returned by `spill`), read one block of `chunk_size` segments at a
+        time.
+    filters : dict
+        See `MyDatabase.filters`.
+    fmt, scratch_dir, chunk_size, metrics : optional
+        See `spill`.
+
+    Returns
+    -------
+    store : SegmentStore
+        Memory-mapped filtered store.
+    """
+
+    if scratch_dir is None:
+        scratch_dir = get_scratch_dir()
+
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True)
+                          .encode('utf-8')).hexdigest()[:16]
+    target = '{path}.filtered.{digest}'.format(
+        path=cache_path(path, fmt=fmt, cache_dir=scratch_dir), digest=digest)
+    if op.isdir(target):
+        return SegmentStore.load(target)
+
+    makedirs(scratch_dir)
+
+    def build(directory):
+        _filter(store, filters, directory, chunk_size=chunk_size)
+
+    with lock(target):
+        if not op.isdir(target):
+            _publish(target, scratch_dir, build, metrics=metrics)
+
+    return SegmentStore.load(target)
+
+
+def _publish(target, scratch_dir, build, metrics=None):
+    """Build store with `build(directory)`, then publish it as `target`"""
+
+    # spill into temporary directory first so that a partially spilled store
+    # is never visible under its final name
+    tmp = tempfile.mkdtemp(dir=scratch_dir, prefix='.tmp.')
+    try:
+        if metrics is None:
+            build(tmp)
+        else:
+            with metrics.stage('spill'):
+                build(tmp)
+        os.rename(tmp, target)
+    except OSError:
+        # someone else spilled the same file in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not op.isdir(target):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
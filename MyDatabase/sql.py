@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""SQLite backend for ad-hoc queries
+
+Annotation files are loaded (once, chunk by chunk) into a local SQLite
+database indexed on uri, label and start time:
+
+>>> store = SQLStore('annotations.db')
+>>> file_id = store.add('protocol1.train.mdtm')
+>>> columns = store.query(files=file_id, uris='^first_', labels=['Alice'],
+...                       start=10., end=60.)
+>>> columns['uri'], columns['start'], columns['duration'], columns['label']
+>>> SegmentStore.from_columns(**columns)  # if needed
+
+Set MYDATABASE_SQLITE environment variable (or `sqlite` attribute of
+MyProtocol1) to the path of such a database for protocols to stream their
+subsets from it, one uri at a time (see `SQLStore.iter_uris`).
+
+Files are keyed on their path and format, and reloaded whenever their size or
+modification time changes. Loading is serialized across processes with the
+same advisory lock as the binary cache (see `MyDatabase.cache.lock`).
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import os.path as op
+
+import numpy as np
+
+from .parsers import iter_chunks, CHUNK_SIZE
+from .store import SegmentStore
+from .cache import lock
+
+SQLITE_ENV = 'MYDATABASE_SQLITE'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    fmt TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    UNIQUE (path, fmt)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    file INTEGER NOT NULL REFERENCES files (id),
+    uri TEXT NOT NULL,
+    start REAL NOT NULL,
+    duration REAL NOT NULL,
+    label TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_uri ON segments (file, uri, start);
+CREATE INDEX IF NOT EXISTS segments_label ON segments (file, label, start);
+CREATE INDEX IF NOT EXISTS segments_start ON segments (file, start);
+"""
+
+# connections are per process (they must not be shared across fork) and per
+# thread (sqlite3 connections cannot be used by several threads)
+_LOCAL = threading.local()
+
+
+def get_database():
+    """Path to SQLite database, or None when the backend is disabled"""
+    return os.environ.get(SQLITE_ENV) or None
+
+
+def _regexp(pattern, value):
+    # `re` caches compiled patterns
+    return value is not None and re.search(pattern, value) is not None
+
+
+def connect(database):
+    """Connection to SQLite `database` (one per process and thread)"""
+
+    connections = _LOCAL.__dict__.setdefault('connections', {})
+    key = (op.realpath(database), os.getpid())
+    if key not in connections:
+        directory = op.dirname(key[0])
+        if not op.isdir(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(key[0])
+        connection.create_function('REGEXP', 2, _regexp)
+        connection.executescript(SCHEMA)
+        connections[key] = connection
+    return connections[key]
+
+
+def _columns(cursor, batch_size=CHUNK_SIZE):
+    """Fetch (uri, start, duration, label) rows of `cursor` as columns"""
+
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        uri, start, duration, label = zip(*rows)
+        chunks.append({'uri': np.array(uri, dtype=np.str_),
+                       'start': np.array(start, dtype=np.float64),
+                       'duration': np.array(duration, dtype=np.float64),
+                       'label': np.array(label, dtype=np.str_)})
+
+    if not chunks:
+        return {'uri': np.array([], dtype=np.str_),
+                'start': np.array([], dtype=np.float64),
+                'duration': np.array([], dtype=np.float64),
+                'label': np.array([], dtype=np.str_)}
+
+    return dict((name, np.concatenate([chunk[name] for chunk in chunks]))
+                for name in ('uri', 'start', 'duration', 'label'))
+
+
+class SQLStore(object):
+    """Annotation files loaded into a SQLite database
+
+    Parameters
+    ----------
+    database : str, optional
+        Path to SQLite database (created if needed). Defaults to
+        MYDATABASE_SQLITE environment variable.
+    """
+
+    def __init__(self, database=None):
+        super(SQLStore, self).__init__()
+        if database is None:
+            database = get_database()
+        if database is None:
+            msg = 'No SQLite database (set {env} environment variable).'
+            raise ValueError(msg.format(env=SQLITE_ENV))
+        self.database = database
+
+    @property
+    def connection(self):
+        return connect(self.database)
+
+    def _file(self, path, fmt=None):
+        """Id of up-to-date annotation file `path`, or None"""
+        stat = os.stat(path)
+        row = self.connection.execute(
+            'SELECT id, size, mtime FROM files WHERE path = ? AND fmt = ?',
+            (op.realpath(path), fmt or '')).fetchone()
+        if row is None or row[1] != stat.st_size or row[2] != stat.st_mtime:
+            return None
+        return row[0]
+
+    def add(self, path, fmt=None, chunk_size=CHUNK_SIZE, metrics=None):
+        """Load annotation file `path` into database, unless already there
+
+        Parameters
+        ----------
+        path : str
+            Path to annotation file.
+        fmt : str, optional
+            See `MyDatabase.parsers.read`.
+        metrics : MyDatabase.instrument.Metrics, optional
+            Record time spent in 'load' stage (and parsing stages, see
+            `MyDatabase.parsers.iter_chunks`).
+
+        Returns
+        -------
+        file_id : int
+            Identifier of annotation file in database.
+        """
+
+        file_id = self._file(path, fmt=fmt)
+        if file_id is not None:
+            return file_id
+
+        with lock(self.database):
+            # someone else might have loaded it while waiting for the lock
+            file_id = self._file(path, fmt=fmt)
+            if file_id is not None:
+                return file_id
+
+            if metrics is None:
+                return self._add(path, fmt=fmt, chunk_size=chunk_size)
+            with metrics.stage('load') as stage:
+                file_id = self._add(path, fmt=fmt, chunk_size=chunk_size,
+                                    metrics=metrics)
+                stage.segments = self.connection.execute(
+                    'SELECT COUNT(*) FROM segments WHERE file = ?',
+                    (file_id, )).fetchone()[0]
+            return file_id
+
+    def _add(self, path, fmt=None, chunk_size=CHUNK_SIZE, metrics=None):
+
+        stat = os.stat(path)
+        realpath = op.realpath(path)
+
+        # one transaction: readers never see a partially loaded file
+        with self.connection as connection:
+
+            # outdated version of the same file
+            for (file_id, ) in connection.execute(
+                    'SELECT id FROM files WHERE path = ? AND fmt = ?',
+                    (realpath, fmt or '')).fetchall():
+                connection.execute('DELETE FROM segments WHERE file = ?',
+                                   (file_id, ))
+                connection.execute('DELETE FROM files WHERE id = ?',
+                                   (file_id, ))
+
+            file_id = connection.execute(
+                'INSERT INTO files (path, fmt, size, mtime) '
+                'VALUES (?, ?, ?, ?)',
+                (realpath, fmt or '', stat.st_size, stat.st_mtime)).lastrowid
+
+            for columns in iter_chunks(path, fmt=fmt, chunk_size=chunk_size,
+                                       metrics=metrics):
+                n = len(columns['uri'])
+                connection.executemany(
+                    'INSERT INTO segments (file, uri, start, duration, label) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    zip([file_id] * n, columns['uri'].tolist(),
+                        columns['start'].tolist(),
+                        columns['duration'].tolist(),
+                        columns['label'].tolist()))
+
+        return file_id
+
+    def uris(self, file_id):
+        """Sorted list of uris of annotation file `file_id`"""
+        return [uri for (uri, ) in self.connection.execute(
+            'SELECT DISTINCT uri FROM segments WHERE file = ? ORDER BY uri',
+            (file_id, ))]
+
+    def query(self, files=None, uris=None, labels=None, start=None, end=None,
+              min_duration=None, max_duration=None):
+        """Segments satisfying all given criteria, as columns
+
+        Parameters
+        ----------
+        files : int or list of int, optional
+            Annotation files (as returned by `add`). Defaults to all files.
+        uris : str or list of str, optional
+            Regular expression (or list) that uris must match.
+        labels : list of str, optional
+            Labels to keep.
+        start, end : float, optional
+            Only keep segments overlapping [start, end] time range.
+        min_duration, max_duration : float, optional
+
+        Returns
+        -------
+        columns : dict
+            'uri', 'start', 'duration' and 'label' np.ndarray, sorted by
+            uri and start time.
+        """
+
+        where, params = [], []
+
+        def among(column, values):
+            where.append('{column} IN ({marks})'.format(
+                column=column, marks=', '.join('?' * len(values))))
+            params.extend(values)
+
+        if files is not None:
+            among('file', [files] if isinstance(files, int) else list(files))
+
+        if uris is not None:
+            if isinstance(uris, (list, tuple)):
+                among('uri', list(uris))
+            else:
+                where.append('uri REGEXP ?')
+                params.append(uris)
+
+        if labels is not None:
+            among('label', list(labels))
+
+        if end is not None:
+            where.append('start < ?')
+            params.append(end)
+
+        if start is not None:
+            where.append('start + duration > ?')
+            params.append(start)
+
+        if min_duration is not None:
+            where.append('duration >= ?')
+            params.append(min_duration)
+
+        if max_duration is not None:
+            where.append('duration <= ?')
+            params.append(max_duration)
+
+        sql = 'SELECT uri, start, duration, label FROM segments'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY uri, start'
+
+        return _columns(self.connection.execute(sql, params))
+
+    def iter_uris(self, file_id, batch_size=CHUNK_SIZE):
+        """Stream annotation file `file_id` one uri at a time, in uri order
+
+        Yields
+        ------
+        uri : str
+        store : SegmentStore
+            Segments of `uri`.
+        """
+
+        cursor = self.connection.execute(
+            'SELECT uri, start, duration, label FROM segments '
+            'WHERE file = ? ORDER BY uri, start', (file_id, ))
+
+        pending = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if pending and pending[-1][0] != row[0]:
+                    yield _flush(pending)
+                    pending = []
+                pending.append(row)
+
+        if pending:
+            yield _flush(pending)
+
+
+def _flush(rows):
+    uri, start, duration, label = zip(*rows)
+    return uri[0], SegmentStore.from_columns(uri, start, duration, label)
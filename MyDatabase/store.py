@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+import os.path as op
+
+import numpy as np
+
+
+# arrays making up a store, as saved on disk
+COLUMNS = ('uris', 'offsets', 'start', 'duration', 'label', 'labels')
+
+# number of segments processed at once by `SegmentStore.extent`
+BLOCK_SIZE = 1 << 20
+
+
+def blocks(offsets, size):
+    """Split files into consecutive blocks of at most `size` segments
+
+    A block is only larger than `size` when it is made of a single file.
+
+    Parameters
+    ----------
+    offsets : (n_uris + 1, ) int64 np.ndarray
+        See `SegmentStore`.
+    size : int
+
+    Yields
+    ------
+    first, last : int
+        Block is made of files [first, last).
+    """
+    n_uris = len(offsets) - 1
+    first = 0
+    while first < n_uris:
+        last = int(np.searchsorted(offsets, offsets[first] + size,
+                                   side='right')) - 1
+        last = min(max(last, first + 1), n_uris)
+        yield first, last
+        first = last
+
+
+class SegmentStore(object):
+    """Columnar storage of (uri, start, duration, label) segments
+
+    Segments are sorted by uri (then by start time) so that all segments of a
+    given file are contiguous and can be accessed without any copy.
+
+    Parameters
+    ----------
+    uris : (n_uris, ) unicode np.ndarray
+        Sorted unique file identifiers.
+    offsets : (n_uris + 1, ) int64 np.ndarray
+        Segments of file `uris[i]` are stored in [offsets[i], offsets[i + 1]).
+    start, duration : (n_segments, ) float64 np.ndarray
+        Segments start time and duration, in seconds.
+    label : (n_segments, ) int32 np.ndarray
+        Segments label, as an index into `labels`.
+    labels : (n_labels, ) unicode np.ndarray
+        Sorted unique labels.
+    """
+
+    # directory this store is memory-mapped from (see `load`)
+    directory_ = None
+
+    def __init__(self, uris, offsets, start, duration, label, labels):
+        super(SegmentStore, self).__init__()
+        self.uris = uris
+        self.offsets = offsets
+        self.start = start
+        self.duration = duration
+        self.label = label
+        self.labels = labels
+
+    def __reduce__(self):
+        # memory-mapped stores are pickled by reference (e.g. when sent to
+        # DataLoader worker processes), so that they are never copied
+        if self.directory_ is not None:
+            return (self.__class__.load, (self.directory_, ))
+        return (self.__class__, tuple(getattr(self, column)
+                                      for column in COLUMNS))
+
+    @classmethod
+    def from_columns(cls, uri, start, duration, label=None):
+        """Build store from (unsorted) per-segment columns
+
+        Parameters
+        ----------
+        uri : (n_segments, ) unicode np.ndarray
+        start, duration : (n_segments, ) float np.ndarray
+        label : (n_segments, ) unicode np.ndarray, optional
+            Defaults to empty labels (e.g. for UEM files).
+        """
+
+        uri = np.asarray(uri, dtype=np.str_)
+        start = np.asarray(start, dtype=np.float64)
+        duration = np.asarray(duration, dtype=np.float64)
+        if label is None:
+            label = np.full(len(uri), u'', dtype=np.str_)
+        label = np.asarray(label, dtype=np.str_)
+
+        uris, uri_code = np.unique(uri, return_inverse=True)
+        labels, label_code = np.unique(label, return_inverse=True)
+
+        # sort by uri first, then by start time
+        order = np.lexsort((start, uri_code))
+        offsets = np.zeros(len(uris) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(uri_code, minlength=len(uris)), out=offsets[1:])
+
+        return cls(uris, offsets,
+                   start[order], duration[order],
+                   label_code[order].astype(np.int32), labels)
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Build store from an iterable of column chunks
+
+        Parameters
+        ----------
+        chunks : iterable of dict
+            As yielded by `MyDatabase.parsers.iter_chunks`.
+        """
+
+        chunks = list(chunks)
+        if not chunks:
+            return cls.from_columns([], [], [], [])
+
+        return cls.from_columns(
+            np.concatenate([chunk['uri'] for chunk in chunks]),
+            np.concatenate([chunk['start'] for chunk in chunks]),
+            np.concatenate([chunk['duration'] for chunk in chunks]),
+            np.concatenate([chunk['label'] for chunk in chunks]))
+
+    def save(self, directory):
+        """Save store as one .npy file per column into existing `directory`"""
+        for column in COLUMNS:
+            np.save(op.join(directory, column + '.npy'),
+                    getattr(self, column))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load store saved into `directory`
+
+        Parameters
+        ----------
+        directory : str
+        mmap_mode : {None, 'r'}, optional
+            Defaults to memory-mapping columns (read-only).
+        """
+        store = cls(*[np.load(op.join(directory, column + '.npy'),
+                              mmap_mode=mmap_mode)
+                      for column in COLUMNS])
+        if mmap_mode is not None:
+            store.directory_ = directory
+        return store
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def nbytes(self):
+        """Size of all columns, in bytes"""
+        return sum(getattr(self, column).nbytes for column in COLUMNS)
+
+    @property
+    def resident(self):
+        """Size of columns held in memory (i.e. not memory-mapped)"""
+        return sum(getattr(self, column).nbytes for column in COLUMNS
+                   if not isinstance(getattr(self, column), np.memmap))
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    @property
+    def uri_index(self):
+        """Per-segment index into `uris`"""
+        return np.repeat(np.arange(len(self.uris)), np.diff(self.offsets))
+
+    def subset(self, mask):
+        """New store made of segments selected by boolean `mask`
+
+        Files left without any segment are removed; labels are kept as is.
+        """
+
+        mask = np.asarray(mask, dtype=bool)
+        counts = np.bincount(self.uri_index[mask], minlength=len(self.uris))
+        keep = counts > 0
+
+        offsets = np.zeros(np.sum(keep) + 1, dtype=np.int64)
+        np.cumsum(counts[keep], out=offsets[1:])
+
+        return self.__class__(self.uris[keep], offsets,
+                              self.start[mask], self.duration[mask],
+                              self.label[mask], self.labels)
+
+    def lookup(self, uris=None, start=None, end=None):
+        """New store made of segments of `uris` overlapping [start, end]
+
+        Files are located by binary search, so that looking a few files up
+        does not go through all segments.
+
+        Parameters
+        ----------
+        uris : iterable of str, optional
+            Defaults to all files. Unknown files are ignored.
+        start, end : float, optional
+            Defaults to no time restriction.
+
+        Returns
+        -------
+        store : SegmentStore
+            Files left without any segment are removed.
+        """
+
+        if uris is None:
+            if start is None and end is None:
+                return self
+            index = np.arange(len(self.uris))
+        else:
+            uris = np.unique(np.asarray(list(uris), dtype=np.str_))
+            index = np.searchsorted(self.uris, uris)
+            found = index < len(self.uris)
+            found[found] = self.uris[index[found]] == uris[found]
+            index = index[found]
+
+        # indices of all segments of selected files
+        first, last = self.offsets[index], self.offsets[index + 1]
+        counts = last - first
+        segment = np.arange(np.sum(counts), dtype=np.int64) + \
+            np.repeat(first - np.cumsum(counts) + counts, counts)
+        owner = np.repeat(np.arange(len(index)), counts)
+
+        keep = np.ones(len(segment), dtype=bool)
+        if end is not None:
+            keep &= self.start[segment] < end
+        if start is not None:
+            keep &= self.start[segment] + self.duration[segment] > start
+        segment, owner = segment[keep], owner[keep]
+
+        counts = np.bincount(owner, minlength=len(index))
+        offsets = np.zeros(np.sum(counts > 0) + 1, dtype=np.int64)
+        np.cumsum(counts[counts > 0], out=offsets[1:])
+
+        return self.__class__(self.uris[index[counts > 0]], offsets,
+                              self.start[segment], self.duration[segment],
+                              self.label[segment], self.labels)
+
+    def columns(self):
+        """Per-segment columns (as expected by `from_columns`)
+
+        Returns
+        -------
+        columns : dict
+            'uri', 'start', 'duration' and 'label' np.ndarray.
+        """
+        return {'uri': self.uris[self.uri_index],
+                'start': self.start, 'duration': self.duration,
+                'label': self.labels[self.label]}
+
+    def __contains__(self, uri):
+        i = np.searchsorted(self.uris, uri)
+        return i < len(self.uris) and self.uris[i] == uri
+
+    def bounds(self, uri):
+        """Return (first, last + 1) index of segments of file `uri`"""
+        i = np.searchsorted(self.uris, uri)
+        if i == len(self.uris) or self.uris[i] != uri:
+            raise KeyError(uri)
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def annotation(self, uri):
+        """Get annotation of file `uri` as pyannote.core.Annotation"""
+        from pyannote.core import Annotation, Segment
+
+        first, last = self.bounds(uri)
+        start = self.start[first:last].tolist()
+        duration = self.duration[first:last].tolist()
+        labels = self.labels[self.label[first:last]].tolist()
+
+        annotation = Annotation(uri=uri)
+        for track, (s, d, l) in enumerate(zip(start, duration, labels)):
+            annotation[Segment(s, s + d), track] = l
+        return annotation
+
+    def extent(self):
+        """Per-file end time of last segment
+
+        Returns
+        -------
+        end : (n_uris, ) float64 np.ndarray
+        """
+        extent = np.zeros(len(self.uris), dtype=np.float64)
+        # block by block, so that memory-mapped stores are never loaded at once
+        for first, last in blocks(self.offsets, BLOCK_SIZE):
+            lo, hi = self.offsets[first], self.offsets[last]
+            if hi == lo:
+                continue
+            end = self.start[lo:hi] + self.duration[lo:hi]
+            extent[first:last] = np.maximum.reduceat(
+                end, self.offsets[first:last] - lo)
+        return extent
+
+    def timelines(self):
+        """Iterate over all files segments as pyannote.core.Timeline
+
+        Yields
+        ------
+        uri : str
+        timeline : pyannote.core.Timeline
+        """
+        from pyannote.core import Segment, Timeline
+
+        # convert all columns at once rather than file by file
+        segments = [Segment(s, e) for s, e in zip(self.start.tolist(),
+                                                  self.end.tolist())]
+        offsets = self.offsets.tolist()
+        for i, uri in enumerate(self.uris.tolist()):
+            yield uri, Timeline(segments=segments[offsets[i]:offsets[i + 1]],
+                                uri=uri)
+
+    def timeline(self, uri):
+        """Get segments of file `uri` as pyannote.core.Timeline"""
+        from pyannote.core import Segment, Timeline
+
+        first, last = self.bounds(uri)
+        start = self.start[first:last].tolist()
+        duration = self.duration[first:last].tolist()
+        return Timeline(segments=[Segment(s, s + d)
+                                  for s, d in zip(start, duration)],
+                        uri=uri)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Offline trace export of protocol loading spans
+
+Set MYDATABASE_TRACE environment variable to a file path to record every
+instrumented stage (see `MyDatabase.instrument`) as a span -- e.g. 'open'
+(file open), 'tokenize' (parse chunk), 'annotation' (build annotation),
+'preprocess' (run one preprocessor) or 'cache' (build binary cache) -- in Chrome
+trace event format. Load the resulting file into chrome://tracing or
+https://ui.perfetto.dev: no collector service is needed.
+
+Events are appended to the file as they are flushed, without closing the
+JSON array (which both viewers accept), so several processes (e.g.
+DataLoader workers) can share the same trace file. Include '{pid}' in the
+path to get one file per process instead.
+"""
+
+import os
+import json
+import atexit
+import threading
+
+TRACE_ENV = 'MYDATABASE_TRACE'
+
+# number of events buffered before being written to disk
+BUFFER_SIZE = 1000
+
+
+class Tracer(object):
+    """Buffered Chrome trace event writer
+
+    Parameters
+    ----------
+    path : str
+        Path to trace file. '{pid}' is replaced by current process id.
+    buffer_size : int, optional
+        Number of events buffered before being written.
+    """
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        super(Tracer, self).__init__()
+        self.path = path
+        self.buffer_size = buffer_size
+        self.lock_ = threading.Lock()
+        self.events_ = []
+
+    def span(self, name, start, duration, args=None):
+        """Record a complete span
+
+        Parameters
+        ----------
+        name : str
+        start, duration : float
+            Start (as returned by `MyDatabase.instrument.wall_time`) and
+            duration of the span, in seconds.
+        args : dict, optional
+            Additional information displayed by trace viewers.
+        """
+
+        event = {'name': name, 'cat': 'MyDatabase', 'ph': 'X',
+                 'ts': 1e6 * start, 'dur': 1e6 * duration,
+                 'pid': os.getpid(), 'tid': threading.current_thread().ident}
+        if args:
+            event['args'] = args
+
+        with self.lock_:
+            self.events_.append(event)
+            if len(self.events_) >= self.buffer_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock_:
+            self._flush()
+
+    def _flush(self):
+
+        if not self.events_:
+            return
+
+        lines = u''.join(json.dumps(event) + u',\n' for event in self.events_)
+        self.events_ = []
+
+        path = self.path.replace('{pid}', str(os.getpid()))
+
+        # whoever creates the file opens the JSON array
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            os.write(fd, b'[\n')
+            os.close(fd)
+        except OSError:
+            pass
+
+        # a single O_APPEND write keeps concurrent writers from interleaving
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, lines.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def clear(self):
+        """Drop buffered events (e.g. those inherited by a forked process)"""
+        self.events_ = []
+        self.lock_ = threading.Lock()
+
+
+_TRACER = []
+
+
+def get_tracer():
+    """Process-wide tracer, or None when MYDATABASE_TRACE is not set"""
+
+    if not _TRACER:
+        path = os.environ.get(TRACE_ENV)
+        tracer = Tracer(path) if path else None
+        if tracer is not None:
+            atexit.register(tracer.flush)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=tracer.clear)
+        _TRACER.append(tracer)
+
+    return _TRACER[0]
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Streaming union of several protocols
+
+>>> from pyannote.database import get_protocol
+>>> protocol = UnionProtocol([
+...     get_protocol('MyDatabase.SpeakerDiarization.MyFirstProtocol'),
+...     get_protocol('OtherDatabase.SpeakerDiarization.OtherProtocol')],
+...     policy='first')
+>>> for current_file in protocol.train():
+...     pass
+
+By default, subsets are merged as sorted streams (k-way merge on uri): each
+source must yield its files sorted by uri (as MyProtocol1 does when subsets
+are loaded into memory) and only one file per source is held in memory at
+any time. Files found in several sources are de-duplicated according to a
+conflict policy:
+
+  * 'first': keep the file from the first source it is found in;
+  * 'last': keep the file from the last source it is found in;
+  * 'merge': union of 'annotation' and 'annotated' of all sources (other
+    fields are taken from the first source);
+  * 'error': raise a ValueError.
+
+When `weights` are given, sources are interleaved instead: files are drawn
+from sources in proportion to their weights (using smooth weighted
+round-robin, hence deterministically), so that files are no longer sorted
+by uri. De-duplication then needs to know in advance which uris are found in
+which source: only the lists of uris (not the files) are kept in memory.
+"""
+
+import heapq
+import itertools
+
+POLICIES = ('first', 'last', 'merge', 'error')
+
+# pyannote.database.Protocol methods providing (not preprocessed) items of
+# each subset: current name first, then legacy one (pyannote.database < 2)
+SUBSETS = {'train': ('train_iter', 'trn_iter'),
+           'development': ('development_iter', 'dev_iter'),
+           'test': ('test_iter', 'tst_iter')}
+
+
+def _iter(protocol, subset):
+    """Items of `protocol` `subset` (as `Protocol.subset_helper` does)"""
+    for method in SUBSETS[subset]:
+        try:
+            return getattr(protocol, method)()
+        except (AttributeError, NotImplementedError):
+            continue
+    msg = 'Protocol does not implement a {subset} subset.'
+    raise NotImplementedError(msg.format(subset=subset))
+
+
+def _keyed(items, source):
+    """Yield (uri, source, item) tuples, checking `items` are sorted by uri
+
+    Ties on uri are broken by source index, so that items themselves are
+    never compared.
+    """
+    previous = None
+    for item in items:
+        uri = item['uri']
+        if previous is not None and uri <= previous:
+            msg = ('Source #{source} is not sorted by uri '
+                   '("{uri}" comes after "{previous}").')
+            raise ValueError(msg.format(source=source, uri=uri,
+                                        previous=previous))
+        previous = uri
+        yield uri, source, item
+
+
+def _resolve(uri, items, policy):
+    """Resolve conflicting (source, item) pairs sharing the same `uri`"""
+
+    if len(items) == 1 or policy == 'first':
+        return items[0][1]
+
+    if policy == 'last':
+        return items[-1][1]
+
+    if policy == 'error':
+        msg = 'File "{uri}" is found in several sources {sources}.'
+        raise ValueError(msg.format(uri=uri,
+                                    sources=[source for source, _ in items]))
+
+    # policy == 'merge'
+    merged = dict(items[0][1])
+    annotation = merged.get('annotation')
+    annotated = merged.get('annotated')
+    if annotation is not None:
+        annotation = annotation.copy()
+    for _, item in items[1:]:
+        if annotation is not None and 'annotation' in item:
+            # tracks of different sources are unrelated: only skip
+            # (segment, label) pairs that are already there
+            for segment, _, label in item['annotation'].itertracks(
+                    yield_label=True):
+                if label not in annotation.get_labels(segment):
+                    annotation[segment, annotation.new_track(segment)] = label
+        if annotated is not None and 'annotated' in item:
+            annotated = annotated.union(item['annotated'])
+    if annotation is not None:
+        merged['annotation'] = annotation
+    if annotated is not None:
+        merged['annotated'] = annotated
+    return merged
+
+
+def merge(sources, policy='first'):
+    """k-way merge of sorted streams of files, de-duplicated on uri
+
+    Parameters
+    ----------
+    sources : iterable of iterable of dict
+        Each source yields files (with a 'uri' field) sorted by uri.
+    policy : {'first', 'last', 'merge', 'error'}, optional
+        Conflict policy for files found in several sources.
+
+    Yields
+    ------
+    current_file : dict
+        Sorted by uri.
+    """
+
+    if policy not in POLICIES:
+        msg = 'Unknown policy "{policy}" (expected one of {policies}).'
+        raise ValueError(msg.format(policy=policy, policies=POLICIES))
+
+    merged = heapq.merge(*[_keyed(items, source)
+                           for source, items in enumerate(sources)])
+    for uri, group in itertools.groupby(merged, key=lambda t: t[0]):
+        items = [(source, item) for _, source, item in group]
+        yield _resolve(uri, items, policy)
+
+
+def _owned(uris, policy):
+    """Which uris of each source are actually yielded (for `interleave`)
+
+    Parameters
+    ----------
+    uris : list of iterable of str
+        Uris of each source.
+
+    Returns
+    -------
+    owned : list of set
+    """
+
+    if policy not in ('first', 'last'):
+        msg = 'Interleaving sources only supports "first" and "last" policies.'
+        raise ValueError(msg)
+
+    order = range(len(uris))
+    if policy == 'last':
+        order = reversed(order)
+
+    owned = [None] * len(uris)
+    seen = set()
+    for source in order:
+        owned[source] = set(uris[source]) - seen
+        seen |= owned[source]
+    return owned
+
+
+def interleave(sources, weights, owned=None):
+    """Interleave streams of files in proportion to `weights`
+
+    Parameters
+    ----------
+    sources : iterable of iterable of dict
+    weights : iterable of positive float
+        Relative weight of each source.
+    owned : list of set, optional
+        Only yield files of each source whose uri is in the corresponding set
+        (see `_owned`). Defaults to yielding every file.
+
+    Yields
+    ------
+    current_file : dict
+    """
+
+    iterators = [iter(items) for items in sources]
+    weights = [float(weight) for weight in weights]
+    if len(weights) != len(iterators):
+        msg = 'Expected {n} weights (one per source), got {m}.'
+        raise ValueError(msg.format(n=len(iterators), m=len(weights)))
+    if any(weight <= 0 for weight in weights):
+        raise ValueError('Weights must be positive.')
+
+    # smooth weighted round-robin: at each step, every active source earns
+    # its weight and the richest one pays back the total of active weights
+    current = [0.] * len(iterators)
+    active = list(range(len(iterators)))
+    while active:
+        total = sum(weights[source] for source in active)
+        for source in active:
+            current[source] += weights[source]
+        source = max(active, key=lambda s: current[s])
+        current[source] -= total
+
+        for item in iterators[source]:
+            if owned is None or item['uri'] in owned[source]:
+                yield item
+                break
+        else:
+            active.remove(source)
+
+
+def _uris(protocol, subset):
+    """Uris of `protocol` `subset`"""
+
+    # MyProtocol1 (and alike) can provide them without building annotations
+    uris = getattr(protocol, 'uris', None)
+    if uris is not None:
+        return uris(subset)
+
+    return [item['uri'] for item in _iter(protocol, subset)]
+
+
+class UnionProtocol(object):
+    """Union of several protocols (see module docstring)
+
+    Parameters
+    ----------
+    protocols : iterable of pyannote.database.Protocol
+        Ordered sources (order matters for 'first' and 'last' policies).
+    policy : {'first', 'last', 'merge', 'error'}, optional
+        Conflict policy for files found in several protocols. Defaults to
+        'first'.
+    weights : iterable of float, optional
+        Interleave protocols in proportion to these weights rather than
+        merging them in uri order. Only supports 'first' and 'last' policies.
+    """
+
+    def __init__(self, protocols, policy='first', weights=None):
+        super(UnionProtocol, self).__init__()
+        self.protocols = list(protocols)
+        if policy not in POLICIES:
+            msg = 'Unknown policy "{policy}" (expected one of {policies}).'
+            raise ValueError(msg.format(policy=policy, policies=POLICIES))
+        self.policy = policy
+        self.weights = None if weights is None else list(weights)
+
+    def _union(self, subset, preprocessed=False):
+
+        if preprocessed:
+            sources = [getattr(protocol, subset)()
+                       for protocol in self.protocols]
+        else:
+            sources = [_iter(protocol, subset) for protocol in self.protocols]
+
+        if self.weights is None:
+            return merge(sources, policy=self.policy)
+
+        owned = _owned([_uris(protocol, subset)
+                        for protocol in self.protocols], self.policy)
+        return interleave(sources, self.weights, owned=owned)
+
+    def trn_iter(self):
+        return self._union('train')
+
+    def dev_iter(self):
+        return self._union('development')
+
+    def tst_iter(self):
+        return self._union('test')
+
+    # each protocol applies its own preprocessors
+    def train(self):
+        return self._union('train', preprocessed=True)
+
+    def development(self):
+        return self._union('development', preprocessed=True)
+
+    def test(self):
+        return self._union('test', preprocessed=True)
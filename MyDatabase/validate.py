@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Validate annotation files
+
+Usage: python -m MyDatabase.validate [--report=<report.json>] [<file>...]
+
+Files are tokenized chunk by chunk; each chunk goes through vectorized checks
+(malformed lines, non-finite or negative start times and durations) and the
+resulting segment store goes through per-file checks (same-label overlaps)
+and cross-file checks (uris shared by several files). Without <file>,
+every annotation file in MyDatabase 'data' directory is validated.
+
+Exits with non-zero status when at least one error is found.
+"""
+
+import sys
+import json
+import os
+import os.path as op
+from collections import defaultdict
+
+import numpy as np
+
+from .parsers import iter_chunks, get_format, CHUNK_SIZE
+from .store import SegmentStore
+
+# at most that many examples are reported for each kind of error
+MAX_EXAMPLES = 10
+
+
+class Validator(object):
+    """Accumulate validation report over one or several annotation files
+
+    Usage
+    -----
+    >>> validator = Validator()
+    >>> store = validator.read('protocol1.train.mdtm')
+    >>> report = validator.report()
+    """
+
+    def __init__(self, max_examples=MAX_EXAMPLES):
+        super(Validator, self).__init__()
+        self.max_examples = max_examples
+        self.files_ = {}
+        self.uris_ = defaultdict(list)
+
+    def _kind(self, path, kind):
+        errors = self.files_[path]['errors']
+        return errors.setdefault(kind, {'count': 0, 'examples': []})
+
+    def _error(self, path, kind, example):
+        """Record one error"""
+        error = self._kind(path, kind)
+        error['count'] += 1
+        if len(error['examples']) < self.max_examples:
+            error['examples'].append(example)
+
+    def _errors(self, path, kind, mask, uri, start):
+        """Record segments selected by boolean `mask` as errors"""
+        n = int(np.sum(mask))
+        if n == 0:
+            return
+        error = self._kind(path, kind)
+        error['count'] += n
+        examples = error['examples']
+        index = np.flatnonzero(mask)[:self.max_examples - len(examples)]
+        # NaN and infinity are not valid JSON
+        examples.extend({'uri': u, 'start': s if np.isfinite(s) else None}
+                        for u, s in zip(uri[index].tolist(),
+                                        start[index].tolist()))
+
+    def check_chunk(self, path, columns):
+        """Vectorized per-segment checks"""
+
+        uri, start, duration = \
+            columns['uri'], columns['start'], columns['duration']
+        self._errors(path, 'non_finite',
+                     ~(np.isfinite(start) & np.isfinite(duration)),
+                     uri, start)
+        self._errors(path, 'negative_start', start < 0, uri, start)
+        self._errors(path, 'negative_duration', duration < 0, uri, start)
+
+    def check_store(self, path, store):
+        """Vectorized per-file checks"""
+
+        if len(store) < 2:
+            return
+
+        # sort segments by (uri, label, start)...
+        uri = np.repeat(np.arange(len(store.uris)), np.diff(store.offsets))
+        order = np.lexsort((store.start, store.label, uri))
+        uri, label = uri[order], store.label[order]
+        start, end = store.start[order], store.end[order]
+
+        # ... so that overlapping segments of the same label are adjacent
+        same = (uri[1:] == uri[:-1]) & (label[1:] == label[:-1])
+        overlap = same & (start[1:] < end[:-1])
+        self._errors(path, 'same_label_overlap', overlap,
+                     store.uris[uri[1:]], start[1:])
+
+    def read(self, path, fmt=None, chunk_size=CHUNK_SIZE):
+        """Validate annotation file `path`
+
+        Returns
+        -------
+        store : SegmentStore
+            Store made of well-formed lines of `path`.
+        """
+
+        self.files_[path] = {'format': fmt, 'segments': 0, 'errors': {}}
+
+        def on_error(lineno, message):
+            self._error(path, 'malformed_line',
+                        {'line': lineno, 'message': message})
+
+        def chunks():
+            for columns in iter_chunks(path, fmt=fmt, chunk_size=chunk_size,
+                                       on_error=on_error):
+                self.check_chunk(path, columns)
+                yield columns
+
+        try:
+            store = SegmentStore.from_chunks(chunks())
+        except ValueError as e:
+            # unreadable file (e.g. unsupported format or missing header)
+            self._error(path, 'unreadable', {'message': str(e)})
+            store = SegmentStore.from_columns([], [], [], [])
+
+        self.files_[path]['segments'] = len(store)
+        self.check_store(path, store)
+
+        # UEM files are expected to share their uris with annotation files
+        if fmt != 'uem' and not path.endswith('.uem'):
+            for uri in store.uris.tolist():
+                self.uris_[uri].append(path)
+
+        return store
+
+    def report(self):
+        """Machine-readable (i.e. JSON-serializable) report"""
+
+        duplicated = dict((uri, paths) for uri, paths in self.uris_.items()
+                          if len(paths) > 1)
+        valid = not duplicated and \
+            not any(f['errors'] for f in self.files_.values())
+
+        return {'valid': valid,
+                'files': self.files_,
+                'duplicated_uris': duplicated}
+
+
+def validate(paths, fmt=None, chunk_size=CHUNK_SIZE):
+    """Validate annotation files
+
+    Parameters
+    ----------
+    paths : iterable of str
+        Paths to annotation files.
+    fmt : str, optional
+        See `MyDatabase.parsers.iter_chunks`.
+
+    Returns
+    -------
+    report : dict
+    """
+    validator = Validator()
+    for path in paths:
+        validator.read(path, fmt=fmt, chunk_size=chunk_size)
+    return validator.report()
+
+
+def main(argv=None):
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Validate annotation files.')
+    parser.add_argument('files', nargs='*', metavar='file')
+    parser.add_argument('--format', default=None, dest='fmt')
+    parser.add_argument('--report', default=None,
+                        help='path to JSON report (default: stdout)')
+    args = parser.parse_args(argv)
+
+    paths = args.files
+    if not paths:
+        from . import DATA_DIR
+        paths = []
+        for name in sorted(os.listdir(DATA_DIR)):
+            try:
+                get_format(name)
+            except ValueError:
+                continue
+            paths.append(op.join(DATA_DIR, name))
+
+    report = validate(paths, fmt=args.fmt)
+
+    if args.report is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return 0 if report['valid'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+
+"""Hot-reload watch mode
+
+>>> from MyDatabase.watch import start
+>>> watcher = start(interval=5.)  # or set MYDATABASE_WATCH=5
+
+Every `interval` seconds, a background thread polls the size and
+modification time of every loaded annotation file (and of its UEM sidecar).
+Once a changed file has settled (i.e. its size and modification time did not
+change between two polls), it is loaded again in the background, along with
+everything derived from it (filtered variants and annotated regions), and
+the new version is swapped in atomically (see `MyDatabase.loader.pin`):
+
+  * protocols iterated over from then on see the new version;
+  * iterators that started before keep going over the previous version,
+    which is forgotten one poll later;
+  * readers never see a partially loaded version.
+
+Versions that fail to load (e.g. invalid annotation file) are retried at
+every poll until they succeed, the previous version being served meanwhile.
+"""
+
+import os
+import warnings
+import threading
+import os.path as op
+
+from . import loader
+
+WATCH_ENV = 'MYDATABASE_WATCH'
+
+# polling interval, in seconds
+INTERVAL = 5.
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class Watcher(object):
+    """Poll loaded annotation files and reload them when they change
+
+    Parameters
+    ----------
+    interval : float, optional
+        Polling interval, in seconds. Defaults to 5.
+    """
+
+    def __init__(self, interval=INTERVAL):
+        super(Watcher, self).__init__()
+        self.interval = interval
+        # (path, fmt) -> (size, mtime) observed at previous poll
+        self.observed_ = {}
+        # versions swapped out at previous poll (evicted at next one)
+        self.retired_ = []
+        self.stopped_ = threading.Event()
+        self.thread_ = None
+        self.lock_ = threading.Lock()
+
+    def poll(self):
+        """Poll once (synchronously)
+
+        Returns
+        -------
+        reloaded : list of str
+            Paths to annotation files that were reloaded.
+        """
+
+        with self.lock_:
+
+            for key in self.retired_:
+                loader.evict(key)
+            self.retired_ = []
+
+            served = dict((key[:2], key) for key in loader.keys())
+            # pin versions that are served at the time they are first seen
+            loader.pin(key for file, key in served.items()
+                       if file not in loader.pinned())
+
+            changed = []
+            for file, key in sorted(served.items()):
+                current = _stat(file[0])
+                previous = self.observed_.get(file)
+                self.observed_[file] = current
+                if current is None or current == key[2:]:
+                    continue
+                # wait for file to settle
+                if current == previous:
+                    changed.append(file)
+
+            # a changed UEM sidecar means reloading its annotation file
+            reloaded = []
+            for path, fmt in changed:
+                annotations = [(path, fmt)]
+                if fmt == 'uem':
+                    annotations = [file for file in served
+                                   if file[1] != 'uem' and
+                                   loader.uem_path(file[0]) == path] or \
+                        annotations
+                for file in annotations:
+                    if file in reloaded:
+                        continue
+                    try:
+                        self._reload(file, served)
+                    except Exception as e:
+                        msg = 'Could not reload {path} ({error}).'
+                        warnings.warn(msg.format(path=file[0], error=e))
+                        continue
+                    reloaded.append(file)
+
+            return [path for path, _ in reloaded]
+
+    def _reload(self, file, served):
+        """Load current version of annotation `file` and swap it in"""
+
+        path, fmt = file
+        old = served[file]
+        # UEM files are sidecars of annotation files, but may be loaded alone
+        uem = None if fmt == 'uem' else loader.uem_path(path)
+        old_uem = served.get((uem, 'uem'))
+
+        options = loader.options_of(old)
+        filters = loader.filters_of(old)
+        annotated = loader.has_annotated(old)
+
+        # load everything against current versions on disk...
+        with loader.snapshot(pinned={}):
+            new = loader._key(path, fmt=fmt)
+            loader.load(path, fmt=fmt, **options)
+            for filters_ in filters:
+                loader.load_filtered(path, fmt=fmt, filters=filters_,
+                                     **options)
+            new_uem = None
+            if uem is not None and op.exists(uem):
+                new_uem = loader._key(uem, fmt='uem')
+                if annotated:
+                    loader.load_annotated(path, fmt=fmt)
+                else:
+                    loader.load(uem, fmt='uem')
+            elif annotated:
+                loader.load_annotated(path, fmt=fmt)
+
+        # ... then swap them in, all at once
+        loader.pin([key for key in (new, new_uem) if key is not None])
+        if new_uem is None and old_uem is not None:
+            loader.unpin([(uem, 'uem')])
+
+        for previous, current in ((old, new), (old_uem, new_uem)):
+            if previous is not None and previous != current:
+                self.retired_.append(previous)
+
+    def _run(self):
+        while not self.stopped_.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                warnings.warn('Watch mode: {error}'.format(error=e))
+
+    def start(self):
+        """Start polling in a background (daemon) thread"""
+        if self.thread_ is not None and self.thread_.is_alive():
+            return self
+        self.stopped_.clear()
+        self.thread_ = threading.Thread(target=self._run,
+                                        name='MyDatabase.watch')
+        self.thread_.daemon = True
+        self.thread_.start()
+        return self
+
+    def stop(self):
+        """Stop polling"""
+        self.stopped_.set()
+        if self.thread_ is not None:
+            self.thread_.join()
+            self.thread_ = None
+
+
+_WATCHER = None
+
+
+def start(interval=None):
+    """Start (process-wide) watch mode
+
+    Parameters
+    ----------
+    interval : float, optional
+        Polling interval, in seconds. Defaults to MYDATABASE_WATCH environment
+        variable, or 5 seconds.
+
+    Returns
+    -------
+    watcher : Watcher
+    """
+    global _WATCHER
+    if interval is None:
+        interval = float(os.environ.get(WATCH_ENV) or INTERVAL)
+    if _WATCHER is None:
+        _WATCHER = Watcher(interval=interval)
+    _WATCHER.interval = interval
+    return _WATCHER.start()
+
+
+def stop():
+    """Stop (process-wide) watch mode"""
+    if _WATCHER is not None:
+        _WATCHER.stop()
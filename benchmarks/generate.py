@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+"""Seeded synthetic MDTM corpus generator
+
+Usage: python -m benchmarks.generate <corpus.mdtm> [--segments=<n>]
+                                                   [--seed=<s>]
+
+Corpora are generated file by file, in chunks, so that even 10^8 segments
+only need a bounded amount of memory:
+
+  * number of segments per file follows a log-normal distribution (a few
+    long files and many short ones);
+  * each file has 2 to 8 speakers, drawn from a global pool of speakers so
+    that the same speaker appears in several files;
+  * speech turns durations are log-normal, and ~10% of turns start before
+    the end of the previous one (overlapping speech).
+"""
+
+import sys
+import io
+
+import numpy as np
+
+# mean number of segments per file
+SEGMENTS_PER_FILE = 200
+# number of distinct speakers in the whole corpus
+SPEAKERS = 10000
+# number of files generated at once
+FILES_PER_CHUNK = 1000
+
+LINE = u'{uri} 1 {start:.3f} {duration:.3f} speaker NA unknown {label}\n'
+
+
+def generate_file(rng, n_segments):
+    """Generate (start, duration, label) columns of one file"""
+
+    duration = np.round(rng.lognormal(mean=1., sigma=0.8, size=n_segments), 3)
+
+    # gap between end of previous turn and start of next one:
+    # mostly positive (silence), sometimes negative (overlapping speech)
+    gap = rng.exponential(0.5, size=n_segments)
+    overlap = rng.random(n_segments) < 0.1
+    overlap[0] = False
+    gap[overlap] = -rng.random(np.sum(overlap)) * \
+        np.roll(duration, 1)[overlap]
+    gap[0] = rng.exponential(2.)
+    start = np.cumsum(gap + np.concatenate([[0.], duration[:-1]]))
+
+    # overlapping turns are given to another speaker
+    speakers = rng.choice(SPEAKERS, size=rng.integers(2, 9), replace=False)
+    index = rng.integers(0, len(speakers), size=n_segments)
+    index[overlap] = (np.roll(index, 1)[overlap] + 1) % len(speakers)
+
+    return np.round(start, 3), duration, speakers[index]
+
+
+def generate(f, n_segments, seed=0):
+    """Write synthetic MDTM corpus with `n_segments` segments into `f`
+
+    Parameters
+    ----------
+    f : file-like
+        Text file opened for writing.
+    n_segments : int
+        Total number of segments.
+    seed : int, optional
+        Random seed. Same seed and `n_segments` give the same corpus.
+
+    Returns
+    -------
+    n_uris : int
+        Number of generated files.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    n_uris = 0
+    remaining = int(n_segments)
+    while remaining > 0:
+
+        sizes = np.maximum(1, rng.lognormal(
+            mean=np.log(SEGMENTS_PER_FILE) - 0.5, sigma=1.,
+            size=FILES_PER_CHUNK).astype(int))
+        sizes = sizes[np.cumsum(sizes) - sizes < remaining]
+        sizes[-1] = min(sizes[-1], remaining - np.sum(sizes[:-1]))
+
+        lines = []
+        for n in sizes.tolist():
+            uri = 'file{i:08d}'.format(i=n_uris)
+            start, duration, label = generate_file(rng, n)
+            lines.extend(
+                LINE.format(uri=uri, start=s, duration=d,
+                            label='spk{l:05d}'.format(l=l))
+                for s, d, l in zip(start.tolist(), duration.tolist(),
+                                   label.tolist()))
+            n_uris += 1
+
+        f.write(u''.join(lines))
+        remaining -= int(np.sum(sizes))
+
+    return n_uris
+
+
+def main(argv=None):
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate MDTM corpus.')
+    parser.add_argument('output')
+    parser.add_argument('--segments', type=float, default=1e5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with io.open(args.output, 'w', encoding='utf-8') as f:
+        n_uris = generate(f, int(args.segments), seed=args.seed)
+
+    sys.stderr.write('{n} segments in {u} files\n'.format(
+        n=int(args.segments), u=n_uris))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Cold import time of MyDatabase plugin
+
+Usage: python benchmarks/import_time.py [--repeat=<n>]
+
+Each statement below is timed in a fresh interpreter (with `-X importtime`),
+from plain `import MyDatabase` (what plugin discovery costs) to actually
+loading the protocol (what iterating over it costs). The last statement
+imports everything the plugin used to import eagerly, for comparison.
+
+Results are printed as JSON (median over <n> runs, in milliseconds).
+"""
+
+import re
+import sys
+import json
+import subprocess
+import os.path as op
+
+ROOT = op.dirname(op.dirname(op.realpath(__file__)))
+
+STATEMENTS = [
+    ('import', 'import MyDatabase'),
+    ('version', 'import MyDatabase; MyDatabase.__version__'),
+    ('entry_point', 'import MyDatabase; MyDatabase.MyDatabase'),
+    ('iterate', 'import MyDatabase; '
+                'next(MyDatabase.MyProtocol1().trn_iter())'),
+    ('eager', 'import MyDatabase; import pyannote.database, '
+              'pyannote.database.protocol, pyannote.core, numpy'),
+]
+
+# -X importtime lines look like "import time:  self | cumulative | name"
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_time(statement):
+    """Total (cumulative) top-level import time in a fresh interpreter, in ms
+
+    Returns
+    -------
+    total : float
+        Sum of cumulative time of top-level imports.
+    wall : float
+        Wall-clock time of the whole statement.
+    """
+
+    code = ('import time; t = time.time(); {statement}; '
+            'print(1000 * (time.time() - t))').format(statement=statement)
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        check=True, universal_newlines=True)
+
+    total = 0.
+    for line in output.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        # only count top-level imports (those with a single space indent)
+        if match and len(match.group(3)) == 1:
+            total += int(match.group(2)) / 1000.
+
+    return total, float(output.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, statement in STATEMENTS:
+        runs = [import_time(statement) for _ in range(args.repeat)]
+        results[name] = {
+            'statement': statement,
+            'import_ms': median([r[0] for r in runs]),
+            'wall_ms': median([r[1] for r in runs]),
+        }
+
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
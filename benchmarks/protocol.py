@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Protocol loading and iteration benchmark
+
+Usage: python -m benchmarks.protocol [--sizes=<n>...] [--modes=<mode>...]
+                                     [--workdir=<dir>] [--output=<json>]
+
+For each corpus size (number of segments), a synthetic MDTM corpus is
+generated (see `benchmarks.generate`) and, for each loading mode, a fresh
+interpreter measures:
+
+  * parse_s / parse_throughput: time to load the corpus (and segments/s);
+  * first_item_s: time from protocol instantiation to first yielded item,
+    measured in its own fresh interpreter (i.e. before anything is loaded);
+  * epoch_s: time of a full (second) pass over the training set;
+  * peak_rss_mb: peak resident memory of the interpreter;
+  * loading_mode: loading mode actually used by the protocol (see
+    `MyProtocol1.memory`).
+
+Loading modes are listed in `MODES`. Results are written as a JSON list of
+records, one per (size, mode) pair.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import subprocess
+import os.path as op
+
+from .generate import generate
+
+# loading mode --> environment variables set before importing MyDatabase
+MODES = {
+    # parse annotation file into memory
+    'parse': {},
+    # build binary cache, then memory-map it
+    'cache_cold': {'MYDATABASE_CACHE': '{workdir}/cache_cold'},
+    # memory-map existing binary cache
+    'cache_warm': {'MYDATABASE_CACHE': '{workdir}/cache_warm'},
+    # stream annotation file one uri at a time (budget so tiny that every
+    # corpus, whatever its size, is streamed)
+    'streaming': {'MYDATABASE_MAX_MEMORY': '1K'},
+}
+
+MODES_ENV = set(name for env in MODES.values() for name in env)
+
+
+def peak_rss_mb():
+    """Peak resident memory of current process, in MB"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024. * 1024. if sys.platform == 'darwin' else 1024.)
+
+
+def benchmark_protocol(path):
+    """Protocol whose training set is corpus `path`"""
+    from MyDatabase.protocol import MyProtocol1
+    # os.path.join(DATA_DIR, path) is `path` when `path` is absolute
+    return type('Benchmark', (MyProtocol1, ),
+                {'subsets': {'train': (path, 'mdtm')}})
+
+
+def measure_first_item(path):
+    """Measure time to first item of corpus `path` (in current process)
+
+    Must run in a fresh interpreter, where nothing was loaded yet.
+    """
+
+    Protocol = benchmark_protocol(path)
+
+    t = time.time()
+    next(Protocol().trn_iter())
+    return {'first_item_s': time.time() - t}
+
+
+def measure(path):
+    """Measure loading and iteration of corpus `path` (in current process)"""
+
+    from MyDatabase.loader import load
+
+    Protocol = benchmark_protocol(path)
+
+    # in streaming mode, annotation file is parsed again at every epoch:
+    # parse_s is then the time of a whole first pass.
+    t = time.time()
+    if os.environ.get('MYDATABASE_MAX_MEMORY'):
+        segments = sum(len(item['annotation'])
+                       for item in Protocol().trn_iter())
+        uris = None
+    else:
+        store = load(path, fmt='mdtm')
+        segments, uris = len(store), len(store.uris)
+    parse_s = time.time() - t
+
+    protocol = Protocol()
+    items = sum(1 for _ in protocol.trn_iter())
+    loading_mode = protocol.memory()['train']['mode']
+
+    t = time.time()
+    for _ in Protocol().trn_iter():
+        pass
+    epoch_s = time.time() - t
+
+    return {
+        'segments': segments,
+        'uris': uris,
+        'items': items,
+        'parse_s': parse_s,
+        'parse_throughput': segments / parse_s if parse_s else None,
+        'epoch_s': epoch_s,
+        'peak_rss_mb': peak_rss_mb(),
+        'loading_mode': loading_mode,
+    }
+
+
+def child(path, env, first_item=False):
+    """Measure corpus `path` in a fresh interpreter"""
+    command = [sys.executable, '-m', 'benchmarks.protocol', '--child', path]
+    if first_item:
+        command.append('--first-item')
+    output = subprocess.check_output(command, env=env,
+                                     universal_newlines=True)
+    return json.loads(output)
+
+
+def run(path, mode, workdir):
+    """Measure corpus `path` in fresh interpreters using loading `mode`"""
+
+    env = dict(os.environ)
+    for name in MODES_ENV:
+        env.pop(name, None)
+    for name, value in MODES[mode].items():
+        env[name] = value.format(workdir=workdir)
+
+    def start():
+        # cold modes start from scratch every time
+        if mode.endswith('_cold') and 'MYDATABASE_CACHE' in env:
+            shutil.rmtree(env['MYDATABASE_CACHE'], ignore_errors=True)
+
+    # warm modes are measured after a first (unmeasured) run
+    if mode.endswith('_warm'):
+        child(path, env)
+
+    # first item is measured on its own, so that it is never served by
+    # whatever was loaded to measure parse_s
+    start()
+    record = child(path, env, first_item=True)
+    start()
+    record.update(child(path, env))
+    return record
+
+
+def corpus(workdir, size, seed=0):
+    """Path to synthetic corpus of `size` segments (generated if needed)"""
+    path = op.join(workdir, 'corpus.{n:d}.{seed:d}.mdtm'.format(
+        n=int(size), seed=seed))
+    if not op.exists(path):
+        if not op.isdir(workdir):
+            os.makedirs(workdir)
+        with open(path, 'w') as f:
+            generate(f, int(size), seed=seed)
+    return path
+
+
+def main(argv=None):
+
+    import argparse
+    import tempfile
+    parser = argparse.ArgumentParser(description='Protocol benchmark.')
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=[1e3, 1e4, 1e5, 1e6])
+    parser.add_argument('--modes', nargs='+', default=sorted(MODES),
+                        choices=sorted(MODES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None,
+                        help='where corpora and caches are kept '
+                             '(default: temporary directory)')
+    parser.add_argument('--output', default=None,
+                        help='path to JSON results (default: stdout)')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--first-item', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        if args.first_item:
+            json.dump(measure_first_item(args.child), sys.stdout)
+        else:
+            json.dump(measure(args.child), sys.stdout)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mydatabase-bench-')
+
+    results = []
+    try:
+        for size in args.sizes:
+
+            path = corpus(workdir, size, seed=args.seed)
+
+            for mode in args.modes:
+                record = {'size': int(size), 'mode': mode, 'seed': args.seed,
+                          'python': platform.python_version()}
+                record.update(run(path, mode, workdir))
+                results.append(record)
+                sys.stderr.write('{size:>10d} {mode:>12s} '
+                                 '{parse_s:8.3f}s {epoch_s:8.3f}s '
+                                 '{peak_rss_mb:8.1f}MB\n'.format(**record))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License (MIT)
+
+# Copyright (c) 2017 CNRS
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# AUTHORS
+# Hervé BREDIN - http://herve.niderb.fr
+
+
+"""Benchmark regression harness
+
+Usage: python -m benchmarks.regression [--baseline=<json>] [--update]
+                                       [--sizes=<n>...] [--modes=<mode>...]
+                                       [--repeat=<n>] [--tolerance=<t>]
+
+Runs protocol benchmarks (see `benchmarks.protocol`) <n> times and compares
+the median of each metric with the one stored in <json> baseline. A metric
+regresses when it is worse than the baseline by more than all of:
+
+  * the relative tolerance <t> (default: 10%);
+  * three times the combined median absolute deviation of current and
+    baseline runs (i.e. more than measurement noise);
+  * an absolute floor (e.g. 10ms for timings, 5MB for memory) below which
+    differences are meaningless.
+
+Exits with status 1 when at least one metric regresses, 0 otherwise (and 2
+when there is no baseline yet). Benchmarks and metrics missing from the
+baseline are reported as not compared. Use --update to (re)write the
+baseline from the current runs instead.
+
+Baselines are machine-specific: record one per machine (and per corpus
+seed) before upgrading this plugin or its dependencies, and compare after.
+"""
+
+import sys
+import json
+import platform
+import os.path as op
+
+from .protocol import MODES, corpus, run
+
+BASELINE = op.join(op.dirname(op.realpath(__file__)), 'baseline.json')
+
+# metric --> (True if higher is better, absolute noise floor)
+METRICS = {
+    'parse_throughput': (True, 0.),
+    'first_item_s': (False, 0.01),
+    'epoch_s': (False, 0.01),
+    'peak_rss_mb': (False, 5.),
+}
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    return .5 * (values[(n - 1) // 2] + values[n // 2])
+
+
+def mad(values):
+    """Median absolute deviation"""
+    m = median(values)
+    return median([abs(value - m) for value in values])
+
+
+def versions():
+    """Versions of dependencies likely to impact performance"""
+    from importlib.metadata import version, PackageNotFoundError
+    result = {'python': platform.python_version()}
+    for name in ['pyannote.database', 'pyannote.core', 'numpy',
+                 'pyannote.db.mydatabase']:
+        try:
+            result[name] = version(name)
+        except PackageNotFoundError:
+            result[name] = None
+    return result
+
+
+def measure(sizes, modes, repeat, seed, workdir):
+    """Run each (size, mode) benchmark `repeat` times
+
+    Returns
+    -------
+    results : dict
+        Maps "<size>/<mode>" to {metric: {'median', 'mad', 'runs'}}.
+    """
+
+    results = {}
+    for size in sizes:
+        path = corpus(workdir, size, seed=seed)
+        for mode in modes:
+            runs = [run(path, mode, workdir) for _ in range(repeat)]
+            key = '{size:d}/{mode}'.format(size=int(size), mode=mode)
+            results[key] = {}
+            for metric in METRICS:
+                values = [r[metric] for r in runs if r[metric] is not None]
+                if not values:
+                    continue
+                results[key][metric] = {'median': median(values),
+                                        'mad': mad(values),
+                                        'runs': values}
+            sys.stderr.write('measured {key}\n'.format(key=key))
+    return results
+
+
+def compare(baseline, current, tolerance=0.1):
+    """Compare current results with baseline ones
+
+    Returns
+    -------
+    comparison : list of dict
+        One record per (benchmark, metric) found in both results, with a
+        boolean 'regression' field.
+    not_compared : list of str
+        Benchmarks and metrics ("<size>/<mode>[/<metric>]") missing from
+        baseline.
+    """
+
+    comparison, not_compared = [], []
+    for key in sorted(current):
+
+        if key not in baseline:
+            not_compared.append(key)
+            continue
+
+        for metric, (higher_is_better, floor) in sorted(METRICS.items()):
+
+            if metric not in current[key]:
+                continue
+            if metric not in baseline[key]:
+                not_compared.append('{key}/{metric}'.format(key=key,
+                                                            metric=metric))
+                continue
+
+            new, old = current[key][metric], baseline[key][metric]
+            delta = new['median'] - old['median']
+            worse = -delta if higher_is_better else delta
+            noise = max(floor, 3. * (new['mad'] + old['mad']))
+
+            comparison.append({
+                'benchmark': key,
+                'metric': metric,
+                'baseline': old['median'],
+                'current': new['median'],
+                'relative': delta / old['median'] if old['median'] else None,
+                'regression': worse > tolerance * abs(old['median']) and
+                              worse > noise,
+            })
+
+    return comparison, not_compared
+
+
+def main(argv=None):
+
+    import argparse
+    import tempfile
+    import shutil
+    parser = argparse.ArgumentParser(description='Benchmark regressions.')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update', action='store_true',
+                        help='write current results as new baseline')
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=[1e4, 1e5])
+    parser.add_argument('--modes', nargs='+', default=sorted(MODES),
+                        choices=sorted(MODES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--output', default=None,
+                        help='path to JSON comparison (default: stdout)')
+    args = parser.parse_args(argv)
+
+    # fail early rather than after minutes of benchmarking
+    if not args.update and not op.exists(args.baseline):
+        sys.stderr.write('baseline {path} does not exist: record one first '
+                         'with --update\n'.format(path=args.baseline))
+        return 2
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mydatabase-bench-')
+    try:
+        current = measure(args.sizes, args.modes, args.repeat, args.seed,
+                          workdir)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.update:
+        with open(args.baseline, 'w') as f:
+            json.dump({'versions': versions(), 'seed': args.seed,
+                       'results': current}, f, indent=2, sort_keys=True)
+        sys.stderr.write('baseline written to {path}\n'.format(
+            path=args.baseline))
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    if baseline.get('seed') != args.seed:
+        sys.stderr.write('warning: baseline was recorded with another seed\n')
+
+    comparison, not_compared = compare(baseline['results'], current,
+                                       tolerance=args.tolerance)
+    report = {'baseline_versions': baseline.get('versions'),
+              'current_versions': versions(),
+              'comparison': comparison,
+              'not_compared': not_compared,
+              'regressions': sum(c['regression'] for c in comparison)}
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    for key in not_compared:
+        sys.stderr.write('NOT COMPARED {key}: missing from baseline\n'.format(
+            key=key))
+
+    for c in comparison:
+        if c['regression']:
+            sys.stderr.write(
+                'REGRESSION {benchmark} {metric}: {baseline:.4g} -> '
+                '{current:.4g}\n'.format(**c))
+
+    return 1 if report['regressions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,8 +27,38 @@
 # Hervé BREDIN - http://herve.niderb.fr/
 
 
+import os.path as op
 import versioneer
 from setuptools import setup, find_packages
+from distutils import log
+
+cmdclass = versioneer.get_cmdclass()
+_build_py = cmdclass['build_py']
+
+
+class build_py(_build_py):
+    """Also compile annotation files (see MyDatabase/compiled.py)"""
+
+    def run(self):
+        _build_py.run(self)
+
+        # replace "MyDatabase" by the new name of MyDatabase directory.
+        # numpy is a build requirement (see pyproject.toml): shipping without
+        # compiled annotation files would silently defeat memory-mapping
+        try:
+            from MyDatabase.compiled import compile_data
+        except ImportError as e:
+            msg = 'cannot compile annotation files ({e}): numpy is needed ' \
+                  'at build time (see pyproject.toml)'
+            raise RuntimeError(msg.format(e=e))
+
+        compiled_dir = op.join(self.build_lib, 'MyDatabase', 'compiled')
+        log.info('compiling annotation files into {d}'.format(d=compiled_dir))
+        compile_data(data_dir=op.join('MyDatabase', 'data'),
+                     compiled_dir=compiled_dir)
+
+
+cmdclass['build_py'] = build_py
 
 setup(
     # replace "mydatabase" by the name of your database
@@ -42,19 +72,21 @@ setup(
     author_email='bredin@limsi.fr',
 
     version=versioneer.get_version(),
-    cmdclass=versioneer.get_cmdclass(),
-    packages=find_packages(),
+    cmdclass=cmdclass,
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
 
     # replace "MyDatabase" by the new name of MyDatabase directory
     package_data={
         'MyDatabase': [
             'data/*',
+            'protocols.json',
         ],
     },
     include_package_data=True,
     install_requires=[
         'pyannote.database >= 0.11.2',
-        'pyannote.parser >= 0.6.5',
+        'pyannote.core >= 1.0',
+        'numpy >= 1.13',
     ],
     classifiers=[
         "Development Status :: 4 - Beta",